@@ -1,32 +1,91 @@
-import pandas as pd
-import random
 import time
+
+# Reference point for --startup-profile
+STARTUP_STARTED = time.perf_counter()
+
+import gc
+import hashlib
+import random
 from datetime import datetime, timedelta
 import json
 import os
 import sys
-import psycopg2
+import csv
+import io
+import signal
+import socket
+from itertools import islice
 
 # Add the Backend Files directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Backend Files'))
 
-# Import the generate_session_id function and get_db_connection from db_config
-# Use the correct path to db_config.py in the root directory
-from db_config import generate_session_id, get_db_connection
+# Phase name -> seconds spent, reported by --startup-profile
+# Format: {'import stdlib': 0.004, 'load bank technical_skills.csv': 0.021, ...}
+STARTUP_TIMINGS = {'import stdlib': time.perf_counter() - STARTUP_STARTED}
+
+
+def record_startup(phase, started):
+    """Add the time since started (a perf_counter value) to a startup phase"""
+    STARTUP_TIMINGS[phase] = STARTUP_TIMINGS.get(phase, 0.0) + time.perf_counter() - started
+
+
+_local_imports_started = time.perf_counter()
+from question_bank import (
+    compile_question_bank, compiled_bank_path, encode_questions, question_bank_cache, read_question_csv,
+    sample_positions
+)
+from recency_store import InMemoryRecencyStore, create_recency_store
+from db_pool import DBConnectionPool
+from db_schema import apply_retention, ensure_partitions, ensure_schema
+from write_behind import WriteBehindQueue
+from grading import ANSWER_LETTERS, NO_ANSWER, answer_code, grade_answers, grade_positions, grade_sessions
+from metrics import metrics, stage_timer, timed
+from request_profiler import request_profiler
+from http_server import ConnectionTracker, HTTPError, Response, json_response, start_http_server
+record_startup('import local modules', _local_imports_started)
+_module_init_started = time.perf_counter()
+
+
+def load_db_config():
+    """Import db_config on first use.
+
+    db_config pulls in psycopg2, which a request served entirely from memory
+    never needs, so the import is deferred until a connection or session ID is
+    actually asked for.
+    """
+    if 'db_config' not in sys.modules:
+        started = time.perf_counter()
+        import db_config
+        record_startup('import db_config', started)
+    return sys.modules['db_config']
+
+
+def get_db_connection():
+    """Open a database connection through db_config; returns (conn, success, error)"""
+    return load_db_config().get_db_connection()
+
+
+def generate_session_id(*args, **kwargs):
+    """Generate a session ID through db_config"""
+    return load_db_config().generate_session_id(*args, **kwargs)
+
+
+# Connection pool shared by every DB helper (and the postgres recency store)
+db_pool = DBConnectionPool(
+    get_db_connection,
+    max_size=int(os.environ.get('QUIZ_DB_POOL_SIZE', 5)),
+    timeout=float(os.environ.get('QUIZ_DB_POOL_TIMEOUT', 10))
+)
 
 
 class QuizSystem:
-    # Class variable to track recently used questions across sessions
-    # Format: {quiz_type: {question_id: timestamp}}
-    recently_used_questions = {
-        '1': {},  # Cognitive Skills
-        '2': {},  # Technical Skills
-        '3': {}   # Soft Skills
-    }
-    
     # How long to consider a question as "recently used" (in seconds)
     QUESTION_COOLDOWN = 3600  # 1 hour
     
+    # Class variable to track recently used questions across sessions.
+    # QUIZ_RECENCY_BACKEND=sqlite or postgres shares it between worker processes and nodes.
+    recency_store = create_recency_store(QUESTION_COOLDOWN, db_pool)
+    
     def __init__(self):
         self.quiz_types = {
             '1': {'name': 'Cognitive Skills', 'file': 'cognitive_skills.csv'},
@@ -44,14 +103,13 @@ class QuizSystem:
         self._cleanup_recently_used()
         
     def load_csv_data(self, file_path):
-        """Load questions from CSV file"""
+        """Load questions from CSV file (uncached, without indexes)"""
         try:
             # Get the directory of the current script
             base_dir = os.path.dirname(os.path.abspath(__file__))
             absolute_path = os.path.join(base_dir, file_path)
             
-            df = pd.read_csv(absolute_path)
-            return df.to_dict('records')
+            return read_question_csv(absolute_path)
         except FileNotFoundError:
             print(f"Error: CSV file '{file_path}' not found.")
             return []
@@ -59,6 +117,29 @@ class QuizSystem:
             print(f"Error loading CSV: {e}")
             return []
     
+    def get_bank_path(self, quiz_type):
+        """Get the absolute path of a quiz type's CSV file"""
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(base_dir, self.quiz_types[quiz_type]['file'])
+    
+    @timed('load_question_bank')
+    def load_question_bank(self, quiz_type):
+        """Load questions for a quiz type through the process-wide bank cache"""
+        try:
+            return question_bank_cache.get(quiz_type, self.get_bank_path(quiz_type))
+        except FileNotFoundError:
+            print(f"Error: CSV file '{self.quiz_types[quiz_type]['file']}' not found.")
+            return []
+        except Exception as e:
+            print(f"Error loading CSV: {e}")
+            return []
+    
+    def warm_up_question_banks(self):
+        """Parse all question banks up front so the first request doesn't pay for it"""
+        question_bank_cache.warm_up({
+            quiz_type: self.get_bank_path(quiz_type) for quiz_type in self.quiz_types
+        })
+    
     def display_quiz_options(self):
         """Display available quiz types"""
         print("\n" + "="*50)
@@ -151,17 +232,19 @@ class QuizSystem:
         
         return config
     
+    @timed('filter_questions')
     def filter_questions(self, all_questions, config, quiz_type):
         """Filter questions based on user configuration"""
-        filtered_questions = all_questions.copy()
-        
         # Filter by difficulty level
-        if config['level'] != 'Mixed':
-            filtered_questions = [q for q in filtered_questions if q['level'] == config['level']]
+        level = config['level'] if config['level'] != 'Mixed' else None
         
         # Filter by domain for technical skills
+        domain = None
         if quiz_type == '2' and config.get('domain') and config['domain'] != 'all':
-            filtered_questions = [q for q in filtered_questions if config['domain'] in q['skills'].lower()]
+            domain = config['domain']
+        
+        # Banks carry prebuilt indexes, so filtering is a set intersection rather than a scan
+        filtered_questions = all_questions.select(level, domain)
         
         # If not enough questions after filtering, relax constraints
         if len(filtered_questions) < config['num_questions']:
@@ -169,49 +252,35 @@ class QuizSystem:
             if not hasattr(self, 'api_mode_active') or not self.api_mode_active:
                 print(f"Warning: Only {len(filtered_questions)} questions available with your criteria.")
                 print("Including questions from other levels/domains to meet your requirement.")
-            filtered_questions = all_questions.copy()
+            filtered_questions = all_questions.select()
         
         return filtered_questions
     
     def _cleanup_recently_used(self):
-        """Clean up old entries in recently_used_questions"""
-        current_time = time.time()
-        for quiz_type in self.recently_used_questions:
-            # Create a copy of keys to avoid modifying dict during iteration
-            question_ids = list(self.recently_used_questions[quiz_type].keys())
-            for question_id in question_ids:
-                timestamp = self.recently_used_questions[quiz_type][question_id]
-                if current_time - timestamp > self.QUESTION_COOLDOWN:
-                    del self.recently_used_questions[quiz_type][question_id]
+        """Clean up old entries in the recently used questions store"""
+        self.recency_store.expire()
+    
+    @staticmethod
+    def session_rng(session_id=None):
+        """Create a random generator derived from the session ID (fresh entropy without one)"""
+        if not session_id:
+            return random.Random()
+        digest = hashlib.sha256(str(session_id).encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
     
+    @timed('select_random_questions')
     def select_random_questions(self, questions, num_questions, session_id=None):
         """Select random questions from filtered list"""
         if len(questions) <= num_questions:
-            return questions
+            return list(questions)
             
         # Clean up old entries in recently_used_questions
         self._cleanup_recently_used()
         
-        # Ensure we don't repeat questions by using a tracking mechanism
-        # We'll use a session ID based seed to make the randomization consistent within a session
-        # but different between sessions
-        if session_id:
-            # Use the session_id to create a seed
-            # Extract numeric parts from the session ID if it's a string
-            if isinstance(session_id, str):
-                # Extract numbers from the session ID string
-                numeric_parts = ''.join(c for c in session_id if c.isdigit())
-                if numeric_parts:
-                    session_seed = int(numeric_parts[:10])  # Use first 10 digits to avoid overflow
-                else:
-                    session_seed = int(time.time())
-            else:
-                session_seed = int(time.time())
-        else:
-            session_seed = int(time.time())
-            
-        # Set the random seed (debug print removed to avoid JSON parsing issues)
-        random.seed(session_seed)
+        # Each selection gets its own generator seeded from the session ID, so the
+        # randomization is consistent within a session but different between sessions,
+        # and concurrent selections never share or reseed the global random module
+        rng = self.session_rng(session_id)
         
         # Get current quiz type
         quiz_type = None
@@ -221,50 +290,177 @@ class QuizSystem:
                 break
         
         if quiz_type and len(questions) > num_questions:
-            # Prioritize questions that haven't been used recently
-            recently_used_ids = self.recently_used_questions.get(quiz_type, {})
-            
-            # Create a question ID for each question (using hash of question text)
-            for q in questions:
-                if 'id' not in q:
-                    q['id'] = hash(q['question'])
-            
-            # Separate questions into two groups: not recently used and recently used
-            not_recently_used = [q for q in questions if q['id'] not in recently_used_ids]
-            recently_used = [q for q in questions if q['id'] in recently_used_ids]
-            
-            # Sort recently used by how long ago they were used (oldest first)
-            recently_used.sort(key=lambda q: recently_used_ids[q['id']])
-            
-            # Stats logging removed to avoid JSON parsing issues
-            
-            # Select questions, prioritizing those not recently used
+            # Prioritize questions that haven't been used recently. Candidates are drawn
+            # lazily in random order and checked against the recency store in small
+            # batches, so the work scales with num_questions rather than the bank size.
+            # Questions carry stable IDs assigned when the bank was loaded.
             selected = []
+            recently_used = []
+            draws = sample_positions(len(questions), rng)
+            while len(selected) < num_questions:
+                remaining_needed = num_questions - len(selected)
+                batch = [questions[position] for position in islice(draws, max(remaining_needed * 2, 16))]
+                if not batch:
+                    break
+                recently_used_ids = self.recency_store.last_used(quiz_type, [q['id'] for q in batch])
+                for q in batch:
+                    if q['id'] in recently_used_ids:
+                        recently_used.append((recently_used_ids[q['id']], q))
+                    elif len(selected) < num_questions:
+                        selected.append(q)
             
-            # First, try to fill with not recently used questions
-            if len(not_recently_used) >= num_questions:
-                selected = random.sample(not_recently_used, num_questions)
-            else:
-                # Use all not recently used questions
-                selected = not_recently_used.copy()
-                
-                # Fill the rest with recently used questions (oldest first)
+            # Every candidate has been drawn if we are still short, so fill the rest
+            # with recently used questions (oldest first)
+            if len(selected) < num_questions:
+                recently_used.sort(key=lambda item: item[0])
                 remaining_needed = num_questions - len(selected)
-                selected.extend(recently_used[:remaining_needed])
+                selected.extend(q for _, q in recently_used[:remaining_needed])
             
             # Mark selected questions as recently used
-            current_time = time.time()
-            for q in selected:
-                self.recently_used_questions.setdefault(quiz_type, {})[q['id']] = current_time
+            self.recency_store.mark_used(quiz_type, [q['id'] for q in selected])
         else:
             # Fallback to simple random selection if we don't have quiz type or not enough questions
-            selected = random.sample(questions, num_questions)
-        
-        # Reset the random seed after selection to avoid affecting other random operations
-        random.seed()
+            selected = rng.sample(questions, num_questions)
         
         return selected
     
+    def _cohort_draws(self, questions, quiz_type, rng):
+        """Yield candidate positions for a cohort, forever.
+
+        The first pass is a random order over every candidate with questions still
+        in their cooldown held back to the end; each later pass is a fresh random
+        order. Every candidate is handed out once before any is repeated.
+        """
+        held_back = []
+        draws = sample_positions(len(questions), rng)
+        while True:
+            batch = list(islice(draws, 256))
+            if not batch:
+                break
+            recently_used_ids = self.recency_store.last_used(quiz_type, [questions[p]['id'] for p in batch])
+            for position in batch:
+                question_id = questions[position]['id']
+                if question_id in recently_used_ids:
+                    held_back.append((recently_used_ids[question_id], position))
+                else:
+                    yield position
+        held_back.sort()
+        for _, position in held_back:
+            yield position
+        while True:
+            yield from sample_positions(len(questions), rng)
+    
+    def select_cohort_questions(self, questions, quiz_type, counts):
+        """Draw one question set per count from the same filtered list, keeping overlap low.
+
+        Sessions are dealt consecutive runs of one shared random stream, so two
+        sessions only share a question once the candidates run out. Returns a list
+        of question lists, in the order of counts.
+        """
+        self._cleanup_recently_used()
+        draws = self._cohort_draws(questions, quiz_type, random.Random())
+        # Positions a session skipped because it already had them; the next session takes them first
+        carried = []
+        question_sets = []
+        for count in counts:
+            count = min(count, len(questions))
+            chosen = []
+            seen = set()
+            pending, carried = carried, []
+            while len(chosen) < count:
+                position = pending.pop(0) if pending else next(draws)
+                if position in seen:
+                    carried.append(position)
+                    continue
+                seen.add(position)
+                chosen.append(position)
+            carried.extend(pending)
+            question_sets.append([questions[position] for position in chosen])
+        
+        # Mark the whole cohort's questions as recently used in one call
+        self.recency_store.mark_used(
+            quiz_type, {question['id'] for question_set in question_sets for question in question_set}
+        )
+        return question_sets
+    
+    def generate_cohort(self, configs, store_sessions=False):
+        """Select questions for many sessions at once and yield one NDJSON line (bytes) per session.
+
+        Configs are api_mode configurations. They are grouped by (quiz_type, level,
+        domain) so each bank is filtered once per group, and each group's sessions
+        are drawn together by select_cohort_questions. Lines come out group by
+        group; each carries "index", the position of its config in the input.
+        Format: {"index": 0, "session_id": "...", "questions": [...]} or {"index": 0, "error": "..."}
+        """
+        self.api_mode_active = True
+        groups = {}
+        for index, config in enumerate(configs):
+            # A bad config only costs its own line
+            try:
+                key, config = self._cohort_session(config)
+            except Exception as e:
+                yield self._cohort_error(index, str(e))
+                continue
+            groups.setdefault(key, []).append((index, config))
+        
+        for (quiz_type, level, domain), members in groups.items():
+            all_questions = self.load_question_bank(quiz_type)
+            if not all_questions:
+                for index, config in members:
+                    yield self._cohort_error(index, "Could not load questions. Please check CSV file.")
+                continue
+            
+            try:
+                counts = [config['num_questions'] for _, config in members]
+                group_config = {'level': level, 'domain': domain, 'num_questions': max(counts)}
+                filtered_questions = self.filter_questions(all_questions, group_config, quiz_type)
+                question_sets = self.select_cohort_questions(filtered_questions, quiz_type, counts)
+            except Exception as e:
+                for index, config in members:
+                    yield self._cohort_error(index, str(e))
+                continue
+            
+            for (index, config), questions in zip(members, question_sets):
+                # A failure here only costs this session its line, not the rest of the stream
+                try:
+                    session_id = config.get('session_id') or generate_session_id(prefix='cohort')
+                    if store_sessions:
+                        queue_test_session(
+                            session_id, config.get('test_type', self.quiz_types[quiz_type]['name']),
+                            level, domain, len(questions), config.get('duration', 30)
+                        )
+                    line = b'{"index": %d, "session_id": %s, "questions": %s}\n' % (
+                        index, json.dumps(session_id).encode('utf-8'),
+                        encode_questions(questions, config.get('include_answers', True))
+                    )
+                except Exception as e:
+                    line = self._cohort_error(index, str(e))
+                yield line
+    
+    def _cohort_session(self, config):
+        """Validate one cohort config; returns its (quiz_type, level, domain) group key and the config"""
+        if not isinstance(config, dict):
+            raise ValueError("Session config must be an object")
+        try:
+            num_questions = int(config.get('num_questions', 10))
+        except (TypeError, ValueError):
+            raise ValueError("num_questions must be an integer")
+        if num_questions < 1:
+            raise ValueError("num_questions must be at least 1")
+        quiz_type = str(config.get('quiz_type', '1'))
+        if quiz_type not in self.quiz_types:
+            raise ValueError(f"Unknown quiz_type: {quiz_type}")
+        level = config.get('level', 'Intermediate')
+        domain = config.get('domain', 'all') if quiz_type == '2' else 'all'
+        for field, value in (('level', level), ('domain', domain), ('session_id', config.get('session_id'))):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{field} must be a string")
+        return (quiz_type, level, domain), dict(config, num_questions=num_questions)
+    
+    @staticmethod
+    def _cohort_error(index, message):
+        return json.dumps({'index': index, 'error': message}).encode('utf-8') + b'\n'
+    
     def format_question(self, question_data, question_num):
         """Format question for display"""
         formatted = f"\nQuestion {question_num}:\n"
@@ -297,12 +493,12 @@ class QuizSystem:
             return elapsed_time >= (duration_minutes * 60)
         return False
     
+    @timed('calculate_results')
     def calculate_results(self, session_id=None):
         """Calculate quiz results"""
         if not self.questions or not self.user_answers:
             return None
         
-        correct_answers = 0
         total_questions = len(self.questions)
         quiz_type = None
         
@@ -312,29 +508,24 @@ class QuizSystem:
                 quiz_type = key
                 break
         
-        # Process each question and store in database if session_id is provided
-        for i, question in enumerate(self.questions):
-            if i < len(self.user_answers):
-                correct_option = question['correct_option'].upper()
-                user_answer = self.user_answers[i]
-                is_correct = (user_answer == correct_option)
-                if is_correct:
-                    correct_answers += 1
-                
-                # Store individual question result in database if session_id is provided
-                if session_id and not self.api_mode_active:
-                    time_taken_per_question = (self.end_time - self.start_time) / len(self.user_answers)
-                    insert_result_to_db(
-                        session_id,
-                        question,
-                        user_answer,
-                        is_correct,
-                        int(time_taken_per_question),
-                        quiz_type
-                    )
+        # Grade every answer in one pass against the bank's answer key
+        answered = self.questions[:len(self.user_answers)]
+        grade = grade_positions(
+            answered[0].bank, [question.position for question in answered],
+            self.user_answers[:len(answered)], total_questions
+        )
+        correct_answers = grade['correct_answers']
+        
+        # Collect answer rows to store if session_id is provided
+        store_answers = session_id and not getattr(self, 'api_mode_active', False)
+        answer_rows = []
+        if store_answers:
+            time_taken_per_question = (self.end_time - self.start_time) / len(self.user_answers)
+            for question, user_answer, is_correct in zip(answered, self.user_answers, grade['is_correct']):
+                answer_rows.append((question, user_answer, is_correct, int(time_taken_per_question)))
         
         score = correct_answers
-        accuracy = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+        accuracy = grade['accuracy']
         
         # Calculate time taken
         time_taken = self.end_time - self.start_time if self.end_time and self.start_time else 0
@@ -346,12 +537,15 @@ class QuizSystem:
             'accuracy': accuracy,
             'time_taken_seconds': time_taken,
             'time_taken_minutes': time_taken_minutes,
-            'correct_answers': correct_answers
+            'correct_answers': correct_answers,
+            'by_skill': grade.get('by_skill', {}),
+            'by_domain': grade.get('by_domain', {}),
+            'by_level': grade.get('by_level', {})
         }
         
-        # Update test session with results if session_id is provided
-        if session_id and not self.api_mode_active:
-            update_test_session(session_id, int(accuracy), int(time_taken))
+        # Hand every answer and the session score to the background writer as one batch
+        if store_answers:
+            queue_quiz_results(session_id, answer_rows, quiz_type, int(accuracy), int(time_taken))
         
         return results
     
@@ -385,13 +579,21 @@ class QuizSystem:
             'questions_and_answers': []
         }
         
+        # Per-answer correctness from the same grading engine as the score
+        answered = self.questions[:len(self.user_answers)]
+        is_correct = []
+        if answered:
+            is_correct = grade_positions(
+                answered[0].bank, [question.position for question in answered], self.user_answers[:len(answered)]
+            )['is_correct']
+        
         # Add question details
         for i, question in enumerate(self.questions):
             q_data = {
                 'question': question['question'],
                 'correct_answer': question['correct_option'],
                 'user_answer': self.user_answers[i] if i < len(self.user_answers) else 'Not answered',
-                'is_correct': (self.user_answers[i] == question['correct_option'].upper()) if i < len(self.user_answers) else False
+                'is_correct': is_correct[i] if i < len(is_correct) else False
             }
             result_data['questions_and_answers'].append(q_data)
         
@@ -417,7 +619,6 @@ class QuizSystem:
                 break
             
             self.current_quiz = self.quiz_types[quiz_choice]['name']
-            csv_file = self.quiz_types[quiz_choice]['file']
             
             print(f"\nYou selected: {self.current_quiz}")
             
@@ -429,7 +630,7 @@ class QuizSystem:
             self.quiz_config = config
             
             # Load questions from CSV
-            all_questions = self.load_csv_data(csv_file)
+            all_questions = self.load_question_bank(quiz_choice)
             if not all_questions:
                 print("Error: Could not load questions. Please check CSV file.")
                 continue
@@ -441,9 +642,9 @@ class QuizSystem:
             session_id = generate_session_id(prefix='cli')
             print(f"Session ID: {session_id}")
             
-            # Store test session in database
+            # Store test session in database (written in the background)
             try:
-                insert_test_session(
+                queue_test_session(
                     session_id,
                     self.current_quiz,
                     config['level'],
@@ -451,7 +652,7 @@ class QuizSystem:
                     config['num_questions'],
                     config['duration']
                 )
-                print("Test session created in database.")
+                print("Test session queued for storage.")
             except Exception as e:
                 print(f"Warning: Could not create test session in database: {e}")
             
@@ -507,24 +708,10 @@ class QuizSystem:
                     # Store test results in database
                     try:
                         # Generate strengths, weaknesses, and recommendations based on results
-                        strengths = []
-                        weaknesses = []
-                        recommendations = []
+                        strengths, weaknesses, recommendations = self.generate_feedback(results['accuracy'])
                         
-                        # Simple logic for generating feedback
-                        if results['accuracy'] >= 80:
-                            strengths.append("Strong understanding of concepts")
-                            recommendations.append("Consider advanced topics")
-                        elif results['accuracy'] >= 60:
-                            strengths.append("Good grasp of basics")
-                            weaknesses.append("Some knowledge gaps")
-                            recommendations.append("Focus on weak areas")
-                        else:
-                            weaknesses.append("Fundamental knowledge gaps")
-                            recommendations.append("Review core concepts")
-                        
-                        # Store results in database
-                        insert_test_results(
+                        # Store results in database (written in the background)
+                        queue_test_results(
                             session_id,
                             int(results['accuracy']),
                             results['correct_answers'],
@@ -534,7 +721,7 @@ class QuizSystem:
                             weaknesses,
                             recommendations
                         )
-                        print("Test results stored in database.")
+                        print("Test results queued for storage.")
                     except Exception as e:
                         print(f"Warning: Could not store test results in database: {e}")
                     
@@ -552,65 +739,780 @@ class QuizSystem:
         
         print("Thank you for using the Quiz System! Goodbye!")
     
+    @timed('select_questions')
+    def select_questions(self, config):
+        """Select questions for an API configuration dict and return (session_id, questions)"""
+        quiz_type = config.get('quiz_type', '1')
+        num_questions = config.get('num_questions', 10)
+        duration = config.get('duration', 30)
+        level = config.get('level', 'Intermediate')
+        domain = config.get('domain', 'all')
+        # Get session ID from config or generate a new one
+        session_id = config.get('session_id')
+        if not session_id:
+            session_id = generate_session_id(prefix='api')
+        
+        # Set current quiz and config
+        self.current_quiz = self.quiz_types[quiz_type]['name']
+        
+        self.quiz_config = {
+            'num_questions': num_questions,
+            'duration': duration,
+            'level': level,
+            'domain': domain
+        }
+        
+        # Load questions from CSV
+        all_questions = self.load_question_bank(quiz_type)
+        if not all_questions:
+            raise ValueError("Could not load questions. Please check CSV file.")
+        
+        # Filter and select questions
+        filtered_questions = self.filter_questions(all_questions, self.quiz_config, quiz_type)
+        self.questions = self.select_random_questions(filtered_questions, num_questions, session_id)
+        return session_id, self.questions
+    
+    @timed('api_mode')
     def api_mode(self, config_json):
         """Run in API mode to return questions based on JSON configuration"""
         try:
             # Set flag to indicate we're running in API mode
             self.api_mode_active = True
             
-            # Parse configuration
-            config = json.loads(config_json)
-            quiz_type = config.get('quiz_type', '1')
-            num_questions = config.get('num_questions', 10)
-            duration = config.get('duration', 30)
-            level = config.get('level', 'Intermediate')
-            domain = config.get('domain', 'all')
-            # Get session ID from config or generate a new one
-            session_id = config.get('session_id')
-            if not session_id:
-                session_id = generate_session_id(prefix='api')
-            print(f"Using session ID: {session_id}")
-            
-            # Set current quiz and config
-            self.current_quiz = self.quiz_types[quiz_type]['name']
-            csv_file = self.quiz_types[quiz_type]['file']
-            
-            self.quiz_config = {
-                'num_questions': num_questions,
-                'duration': duration,
-                'level': level,
-                'domain': domain
-            }
+            # Parse configuration (worker mode passes an already decoded dict)
+            config = json.loads(config_json) if isinstance(config_json, str) else config_json
+            # QUIZ_PROFILE_SAMPLE_RATE (or "profile": true with QUIZ_PROFILE_REQUESTS=1) profiles this one request
+            if request_profiler.should_profile(config.get('profile')):
+                # Profiles are tagged with the session ID, so settle it up front
+                if not config.get('session_id'):
+                    config = dict(config, session_id=generate_session_id(prefix='api'))
+                return request_profiler.profile_call(
+                    self._api_response, config, session_id=config['session_id'], label='api_mode'
+                )
+            return self._api_response(config)
             
-            # Load questions from CSV
-            all_questions = self.load_csv_data(csv_file)
-            if not all_questions:
-                return json.dumps({"error": "Could not load questions. Please check CSV file."})
+        except Exception as e:
+            metrics.record_error('api_mode')
+            return json.dumps({"error": str(e)})
+    
+    def _api_response(self, config):
+        session_id, questions = self.select_questions(config)
+        # Diagnostics go to stderr so stdout only ever carries the JSON payload
+        print(f"Using session ID: {session_id}", file=sys.stderr)
+        
+        # Return questions as JSON, joined from the fragments encoded at bank load.
+        # "include_answers": false leaves correct_option out for client-facing payloads.
+        with stage_timer('serialize_questions'):
+            return encode_questions(questions, config.get('include_answers', True)).decode('ascii')
+    
+    @staticmethod
+    def generate_feedback(accuracy):
+        """Generate strengths, weaknesses, and recommendations for an accuracy percentage"""
+        strengths = []
+        weaknesses = []
+        recommendations = []
+        
+        # Simple logic for generating feedback
+        if accuracy >= 80:
+            strengths.append("Strong understanding of concepts")
+            recommendations.append("Consider advanced topics")
+        elif accuracy >= 60:
+            strengths.append("Good grasp of basics")
+            weaknesses.append("Some knowledge gaps")
+            recommendations.append("Focus on weak areas")
+        else:
+            weaknesses.append("Fundamental knowledge gaps")
+            recommendations.append("Review core concepts")
+        
+        return strengths, weaknesses, recommendations
+
+
+def prepare_database():
+    """Run pending schema migrations at startup so the write path never probes the catalog"""
+    started = time.perf_counter()
+    try:
+        ensure_schema(db_pool)
+    except Exception as e:
+        print(f"Warning: Could not migrate database schema: {e}")
+    record_startup('schema migrations', started)
+    started = time.perf_counter()
+    maintain_partitions()
+    record_startup('partition maintenance', started)
+
+
+# Months of quiz_results/test_results history to keep (0 keeps everything). With
+# QUIZ_ARCHIVE_SCHEMA set, expired partitions are moved there instead of dropped.
+RETENTION_MONTHS = int(os.environ.get('QUIZ_RETENTION_MONTHS', 0))
+ARCHIVE_SCHEMA = os.environ.get('QUIZ_ARCHIVE_SCHEMA') or None
+
+
+@timed('db.maintain_partitions')
+def maintain_partitions():
+    """Create the coming months' result partitions and expire old ones.
+
+    Runs at startup; long-running services should also run the partitions mode
+    from cron (rows for a month without a partition land in the default one and
+    are moved over when it is created).
+    """
+    try:
+        for name in ensure_partitions(db_pool):
+            print(f"Created partition {name}", file=sys.stderr)
+        if RETENTION_MONTHS > 0:
+            for name in apply_retention(db_pool, RETENTION_MONTHS, ARCHIVE_SCHEMA):
+                print(f"{'Archived' if ARCHIVE_SCHEMA else 'Dropped'} partition {name}", file=sys.stderr)
+    except Exception as e:
+        metrics.record_error('db.maintain_partitions')
+        print("Database Error:", e, file=sys.stderr)
+
+
+# Set by --startup-profile
+startup_profile_enabled = False
+
+
+def report_startup_profile():
+    """Print import and initialization timings as one JSON line on stderr (--startup-profile)"""
+    if not startup_profile_enabled:
+        return
+    phases = dict(STARTUP_TIMINGS)
+    for quiz_type, bank in question_bank_cache.stats()['banks'].items():
+        source = 'compiled' if bank['compiled'] else 'csv'
+        phases[f"load bank {os.path.basename(bank['path'])} ({source})"] = bank['load_ms'] / 1000
+    # Format: {"startup_profile": {"total_ms": 41.2, "phases_ms": {"import stdlib": 3.1, ...}}}
+    print(json.dumps({'startup_profile': {
+        'total_ms': round((time.perf_counter() - STARTUP_STARTED) * 1000, 3),
+        'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in phases.items()}
+    }}), file=sys.stderr)
+
+
+def service_stats():
+    """Collect the question bank cache, DB pool, write-behind and latency counters"""
+    return {
+        'question_bank_cache': question_bank_cache.stats(),
+        'db_pool': db_pool.stats(),
+        'write_behind': write_behind.stats(),
+        'latency': metrics.snapshot(),
+        'profiler': request_profiler.stats()
+    }
+
+
+def handle_worker_request(line):
+    """Handle one newline-delimited JSON request and return one JSON response line"""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.pop('request_id', None)
+        if request.get('command') == 'stats':
+            result = json.dumps(service_stats())
+            return '{"request_id": %s, "result": %s}' % (json.dumps(request_id), result)
+        if request.get('command') == 'metrics':
+            result = json.dumps(metrics.prometheus_text())
+            return '{"request_id": %s, "result": %s}' % (json.dumps(request_id), result)
+        quiz_system = QuizSystem()
+        if request.get('command') == 'grade':
+            # Grading only; the caller records the results it gets back
+            quiz_type = str(request.get('quiz_type', '1'))
+            bank = quiz_system.load_question_bank(quiz_type)
+            if not bank:
+                raise ValueError("Could not load questions. Please check CSV file.")
+            result = json.dumps(grade_sessions(bank, request.get('sessions') or []))
+            return '{"request_id": %s, "result": %s}' % (json.dumps(request_id), result)
+        result = quiz_system.api_mode(request)
+        return '{"request_id": %s, "result": %s}' % (json.dumps(request_id), result)
+    except Exception as e:
+        return json.dumps({"request_id": request_id, "result": {"error": str(e)}})
+
+
+def serve(socket_path=None):
+    """Run as a long-lived worker that answers newline-delimited JSON requests.
+
+    Each request line is an api_mode configuration with an optional "request_id";
+    each response line is {"request_id": ..., "result": <api_mode output>}. A
+    {"command": "stats"} request returns the service stats, {"command": "metrics"}
+    the latency histograms in Prometheus text format, and {"command": "grade",
+    "quiz_type": ..., "sessions": [...]} grades answers in bulk. Parsed question banks
+    stay in memory between requests, so only worker startup pays for interpreter
+    startup and CSV parsing.
+    """
+    # Keep stray prints from corrupting the response stream
+    output = sys.stdout
+    sys.stdout = sys.stderr
+    
+    QuizSystem().warm_up_question_banks()
+    prepare_database()
+    write_behind.start()
+    report_startup_profile()
+    
+    if socket_path is None:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            response = handle_worker_request(line)
+            output.write(response + "\n")
+            output.flush()
+        return
+    
+    import socketserver
+    
+    class WorkerRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                response = handle_worker_request(line.decode('utf-8'))
+                self.wfile.write((response + "\n").encode('utf-8'))
+                self.wfile.flush()
+    
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, WorkerRequestHandler)
+    server.daemon_threads = True
+    print(f"Quiz worker listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# Most questions one session (or one cohort config) may ask for
+MAX_QUESTIONS_PER_REQUEST = int(os.environ.get('QUIZ_MAX_QUESTIONS', 500))
+
+
+def parse_json_body(body):
+    """Decode a JSON object request body or fail with 400"""
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, 'Request body must be JSON')
+    if not isinstance(data, dict):
+        raise HTTPError(400, 'Request body must be a JSON object')
+    return data
+
+
+def require_fields(data, *fields):
+    missing = [field for field in fields if data.get(field) in (None, '')]
+    if missing:
+        raise HTTPError(400, f"Missing required fields: {', '.join(missing)}")
+
+
+def int_field(value, field, minimum=0, maximum=None):
+    """Parse an integer request field (a number or a numeric string) or fail with 400"""
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(value)
+        number = int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{field} must be an integer")
+    if number < minimum:
+        raise HTTPError(400, f"{field} must be at least {minimum}")
+    if maximum is not None and number > maximum:
+        raise HTTPError(400, f"{field} must be at most {maximum}")
+    return number
+
+
+def answers_field(answers, field='answers'):
+    """Validate a list of {'question_id': ..., 'chosen_option': ...} answers, with integer IDs"""
+    if answers is None:
+        return []
+    if not isinstance(answers, list):
+        raise HTTPError(400, f"{field} must be a list")
+    validated = []
+    for index, answer in enumerate(answers):
+        if not isinstance(answer, dict) or answer.get('question_id') in (None, ''):
+            raise HTTPError(400, f"{field}[{index}] must be an object with a question_id")
+        validated.append(dict(answer, question_id=int_field(answer['question_id'], f"{field}[{index}].question_id")))
+    return validated
+
+
+def text_field(value, field):
+    """Check that an optional request field is a string, or fail with 400"""
+    if value is not None and not isinstance(value, str):
+        raise HTTPError(400, f"{field} must be a string")
+    return value
+
+
+def load_bank_for_request(quiz_system, quiz_type):
+    """Load the bank for a request's quiz type or fail with 400/500"""
+    if quiz_type not in quiz_system.quiz_types:
+        raise HTTPError(400, f"Unknown quiz_type: {quiz_type}")
+    bank = quiz_system.load_question_bank(quiz_type)
+    if not bank:
+        raise HTTPError(500, "Could not load questions. Please check CSV file.")
+    return bank
+
+
+def http_select_questions(data):
+    """POST /questions: select questions for a new session and record the session"""
+    quiz_system = QuizSystem()
+    quiz_system.api_mode_active = True
+    quiz_type = str(data.get('quiz_type', '1'))
+    text_field(data.get('level'), 'level')
+    text_field(data.get('domain'), 'domain')
+    data['num_questions'] = int_field(
+        data.get('num_questions', 10), 'num_questions', minimum=1, maximum=MAX_QUESTIONS_PER_REQUEST
+    )
+    data['duration'] = int_field(data.get('duration', 30), 'duration', minimum=1)
+    load_bank_for_request(quiz_system, quiz_type)
+    data['quiz_type'] = quiz_type
+    
+    session_id, questions = quiz_system.select_questions(data)
+    # Callers that record the session themselves pass "store_session": false
+    if data.get('store_session', True):
+        queue_test_session(
+            session_id,
+            data.get('test_type', quiz_system.current_quiz),
+            quiz_system.quiz_config['level'],
+            quiz_system.quiz_config['domain'],
+            len(questions),
+            quiz_system.quiz_config['duration']
+        )
+    # Same shape as json_response({'session_id': ..., 'questions': [...]}), without re-encoding the questions
+    with stage_timer('serialize_questions'):
+        body = b'{"session_id": %s, "questions": %s}' % (
+            json.dumps(session_id).encode('utf-8'), encode_questions(questions, data.get('include_answers', True))
+        )
+    return Response(body)
+
+
+def http_submit_answer(data):
+    """POST /answers: grade one answer by question ID and record it"""
+    require_fields(data, 'session_id', 'question_id', 'chosen_option')
+    question_id = int_field(data['question_id'], 'question_id')
+    time_taken = int_field(data.get('time_taken', 0), 'time_taken')
+    quiz_system = QuizSystem()
+    quiz_type = str(data.get('quiz_type', '1'))
+    bank = load_bank_for_request(quiz_system, quiz_type)
+    
+    question = bank.get_question(question_id)
+    if question is None:
+        raise HTTPError(404, f"Unknown question_id: {data['question_id']}")
+    is_correct = grade_positions(bank, [question.position], [data['chosen_option']])['is_correct'][0]
+    # Stored as a letter even when the client sent an option index
+    code = answer_code(data['chosen_option'])
+    chosen_option = ANSWER_LETTERS[code] if code != NO_ANSWER else str(data['chosen_option']).upper()
+    
+    queue_quiz_results(
+        data['session_id'],
+        [(question, chosen_option, is_correct, time_taken)],
+        quiz_type
+    )
+    return json_response({'is_correct': is_correct, 'correct_option': question['correct_option']})
+
+
+def record_graded_session(quiz_system, quiz_type, session_id, grade, time_taken):
+    """Queue a graded session's score and results and return its feedback"""
+    accuracy = grade['accuracy']
+    strengths, weaknesses, recommendations = quiz_system.generate_feedback(accuracy)
+    # Answers were stored as they were submitted; only the session score and results remain
+    queue_quiz_results(session_id, [], quiz_type, int(accuracy), time_taken)
+    queue_test_results(
+        session_id, int(accuracy), grade['correct_answers'], grade['total_questions'], time_taken,
+        strengths, weaknesses, recommendations
+    )
+    return {'strengths': strengths, 'weaknesses': weaknesses, 'recommendations': recommendations}
+
+
+def http_results(data):
+    """POST /results: score a finished session from its answers and record the results"""
+    require_fields(data, 'session_id')
+    answers = answers_field(data.get('answers'))
+    total_questions = int_field(data.get('total_questions', len(answers)), 'total_questions')
+    time_taken = int_field(data.get('time_taken', 0), 'time_taken')
+    quiz_system = QuizSystem()
+    quiz_type = str(data.get('quiz_type', '1'))
+    bank = load_bank_for_request(quiz_system, quiz_type)
+    
+    grade = grade_answers(bank, answers, total_questions)
+    
+    session_id = data['session_id']
+    feedback = record_graded_session(quiz_system, quiz_type, session_id, grade, time_taken)
+    return json_response({
+        'session_id': session_id,
+        **grade,
+        'time_taken_seconds': time_taken,
+        **feedback
+    })
+
+
+def http_grade(data):
+    """POST /grade: grade many sessions' answers in one request and record their results.
+
+    Body: {"quiz_type": "2", "sessions": [{"session_id": ..., "answers": [...],
+    "total_questions": N, "time_taken": S}], "store_results": true}
+    """
+    require_fields(data, 'sessions')
+    if not isinstance(data['sessions'], list):
+        raise HTTPError(400, 'sessions must be a list')
+    sessions = []
+    for index, session in enumerate(data['sessions']):
+        if not isinstance(session, dict):
+            raise HTTPError(400, f"sessions[{index}] must be an object")
+        answers = answers_field(session.get('answers'), f"sessions[{index}].answers")
+        sessions.append(dict(
+            session, answers=answers,
+            total_questions=int_field(session.get('total_questions', len(answers)), f"sessions[{index}].total_questions"),
+            time_taken=int_field(session.get('time_taken', 0), f"sessions[{index}].time_taken")
+        ))
+    quiz_system = QuizSystem()
+    quiz_type = str(data.get('quiz_type', '1'))
+    bank = load_bank_for_request(quiz_system, quiz_type)
+    
+    results = grade_sessions(bank, sessions)
+    # Callers that only want scores pass "store_results": false
+    if data.get('store_results', True):
+        for session, result in zip(sessions, results):
+            if session.get('session_id'):
+                time_taken = session['time_taken']
+                result.update(record_graded_session(quiz_system, quiz_type, session['session_id'], result, time_taken))
+    return json_response({'results': results})
+
+
+def http_cohort(data):
+    """POST /cohort: select questions for a list of session configs, streamed back as NDJSON"""
+    import asyncio
+    require_fields(data, 'sessions')
+    if not isinstance(data['sessions'], list):
+        raise HTTPError(400, 'sessions must be a list of session configs')
+    # Reject bad configs while an error status can still be sent; the stream has no way back
+    sessions = []
+    for index, config in enumerate(data['sessions']):
+        if not isinstance(config, dict):
+            raise HTTPError(400, f"sessions[{index}] must be an object")
+        for field in ('level', 'domain', 'session_id'):
+            text_field(config.get(field), f"sessions[{index}].{field}")
+        sessions.append(dict(
+            config,
+            num_questions=int_field(config.get('num_questions', 10), f"sessions[{index}].num_questions",
+                                    minimum=1, maximum=MAX_QUESTIONS_PER_REQUEST),
+            duration=int_field(config.get('duration', 30), f"sessions[{index}].duration", minimum=1)
+        ))
+    lines = QuizSystem().generate_cohort(sessions, data.get('store_sessions', True))
+    
+    async def stream():
+        if recency_store_blocks():
+            loop = asyncio.get_running_loop()
+            while True:
+                line = await loop.run_in_executor(None, next, lines, None)
+                if line is None:
+                    break
+                yield line
+            return
+        for line in lines:
+            yield line
+            # Let other connections run between sessions of a large cohort
+            await asyncio.sleep(0)
+    
+    return Response(stream=stream(), content_type='application/x-ndjson')
+
+
+HTTP_ROUTES = {
+    ('POST', '/questions'): http_select_questions,
+    ('POST', '/answers'): http_submit_answer,
+    ('POST', '/results'): http_results,
+    ('POST', '/grade'): http_grade,
+    ('POST', '/cohort'): http_cohort,
+}
+
+
+async def handle_http_request(method, path, body):
+    """Route one HTTP request to its QuizSystem handler"""
+    if method == 'OPTIONS':
+        return Response(b'', content_type='text/plain')
+    if path == '/health':
+        return json_response({'status': 'ok'})
+    if path == '/stats':
+        return json_response(service_stats())
+    if path == '/metrics':
+        return Response(metrics.prometheus_text(), content_type='text/plain; version=0.0.4')
+    
+    handler = HTTP_ROUTES.get((method, path))
+    if handler is None:
+        if any(route_path == path for _, route_path in HTTP_ROUTES):
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"No route for {path}")
+    data = parse_json_body(body)
+    # Selection and grading are in-memory and O(num_questions) and DB writes go
+    # to the write-behind thread, but a SQLite or Postgres recency store queries
+    # its database on every selection; run those handlers off the event loop
+    if recency_store_blocks():
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, run_http_handler, handler, method, path, data)
+    return run_http_handler(handler, method, path, data)
+
+
+def recency_store_blocks():
+    """True when question selection makes blocking database calls (non-memory recency store)"""
+    return not isinstance(QuizSystem.recency_store, InMemoryRecencyStore)
+
+
+def run_http_handler(handler, method, path, data):
+    """Call a route handler, timed and optionally profiled"""
+    with stage_timer(f"http {method} {path}"):
+        if request_profiler.should_profile(data.get('profile')):
+            # New sessions get their ID before profiling so the profile can be tagged with it
+            if path == '/questions' and not data.get('session_id'):
+                data['session_id'] = generate_session_id(prefix='api')
+            # Streaming routes (/cohort) do most of their work after this returns
+            return request_profiler.profile_call(
+                handler, data, session_id=data.get('session_id'), label=path.strip('/') or 'root'
+            )
+        return handler(data)
+
+
+async def serve_http_forever(host='127.0.0.1', port=8000, sock=None):
+    """Serve HTTP until SIGTERM, then stop accepting and let in-flight requests finish"""
+    import asyncio
+    connections = ConnectionTracker()
+    server = await start_http_server(handle_http_request, host, port, sock=sock, connections=connections)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    
+    await stopping.wait()
+    server.close()
+    if not await connections.drain(GRACEFUL_SHUTDOWN_TIMEOUT):
+        print(f"{connections.active} requests still running after {GRACEFUL_SHUTDOWN_TIMEOUT}s; "
+              f"closing them", file=sys.stderr)
+
+
+def run_http_service(host='127.0.0.1', port=8000):
+    """Run the asyncio HTTP quiz service"""
+    QuizSystem().warm_up_question_banks()
+    prepare_database()
+    write_behind.start()
+    report_startup_profile()
+    print(f"Quiz service listening on http://{host}:{port}", file=sys.stderr)
+    import asyncio
+    asyncio.run(serve_http_forever(host, port))
+
+
+# Seconds a stopping worker gets to finish in-flight requests
+GRACEFUL_SHUTDOWN_TIMEOUT = 30
+
+# How often the pre-fork supervisor checks the question bank CSVs for changes (seconds)
+RELOAD_CHECK_INTERVAL = float(os.environ.get('QUIZ_RELOAD_INTERVAL', 5))
+
+
+def spawn_http_worker(sock):
+    """Fork one HTTP worker that serves on the shared listening socket"""
+    pid = os.fork()
+    if pid:
+        return pid
+    
+    # Child: the parent handles Ctrl-C and tells workers to stop with SIGTERM
+    exit_code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Banks were loaded before the fork and are shared copy-on-write; the
+        # supervisor reloads them and replaces workers when a CSV changes
+        question_bank_cache.check_files = False
+        # Connections and threads don't survive fork; each worker opens its own
+        QuizSystem.recency_store = create_recency_store(QuizSystem.QUESTION_COOLDOWN, db_pool)
+        write_behind.start()
+        import asyncio
+        asyncio.run(serve_http_forever(sock=sock))
+    except Exception as e:
+        print(f"Quiz worker {os.getpid()} failed: {e}", file=sys.stderr)
+        exit_code = 1
+    finally:
+        write_behind.stop()
+        os._exit(exit_code)
+
+
+def run_prefork_http_service(host='127.0.0.1', port=8000, workers=None):
+    """Run the HTTP quiz service as a supervisor plus N forked workers.
+
+    Question banks and their indexes are loaded once in the supervisor and
+    inherited copy-on-write by every worker; all workers accept on one listening
+    socket. When a CSV changes (or on SIGHUP) the supervisor reloads the banks,
+    forks a fresh generation of workers and gracefully stops the old one.
+    """
+    workers = workers or os.cpu_count() or 1
+    quiz_system = QuizSystem()
+    quiz_system.warm_up_question_banks()
+    prepare_database()
+    # Don't hand open database connections to the children
+    db_pool.close_all()
+    
+    sock = socket.create_server((host, port), backlog=1024)
+    report_startup_profile()
+    print(f"Quiz service listening on http://{host}:{port} with {workers} workers", file=sys.stderr)
+    
+    state = {'reload': False, 'stop': False}
+    
+    def request_reload(signum, frame):
+        state['reload'] = True
+    
+    def request_stop(signum, frame):
+        state['stop'] = True
+    
+    signal.signal(signal.SIGHUP, request_reload)
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    def spawn_generation():
+        # Objects that exist now are never collected, so GC won't dirty shared pages
+        gc.collect()
+        gc.freeze()
+        return {spawn_http_worker(sock) for _ in range(workers)}
+    
+    def stop_workers(pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    current = spawn_generation()
+    retiring = set()
+    last_check = time.time()
+    try:
+        while not state['stop']:
+            time.sleep(0.5)
             
-            # Filter and select questions
-            filtered_questions = self.filter_questions(all_questions, self.quiz_config, quiz_type)
-            self.questions = self.select_random_questions(filtered_questions, num_questions, session_id)
+            # Reap exited workers and replace any current-generation worker that died
+            while True:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                retiring.discard(pid)
+                if pid in current:
+                    current.discard(pid)
+                    print(f"Quiz worker {pid} exited unexpectedly; restarting", file=sys.stderr)
+                    current.add(spawn_http_worker(sock))
             
-            # Return questions as JSON
-            return json.dumps(self.questions)
+            if time.time() - last_check >= RELOAD_CHECK_INTERVAL:
+                last_check = time.time()
+                if question_bank_cache.stale_banks():
+                    state['reload'] = True
             
+            if state['reload']:
+                state['reload'] = False
+                gc.unfreeze()
+                # Old workers keep serving while the changed banks are rebuilt here
+                for quiz_type in question_bank_cache.refresh():
+                    print(f"Question bank {quiz_type} reloaded: "
+                          f"{question_bank_cache.stats()['banks'][quiz_type]['last_reload']}", file=sys.stderr)
+                print("Question banks reloaded; replacing workers", file=sys.stderr)
+                retiring |= current
+                current = spawn_generation()
+                stop_workers(retiring)
+    finally:
+        stop_workers(current | retiring)
+        for pid in current | retiring:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+
+
+def run_cohort(source):
+    """Write NDJSON question sets to stdout for a JSON list of session configs read from source"""
+    try:
+        if source in (None, '-'):
+            configs = json.load(sys.stdin)
+        else:
+            with open(source) as f:
+                configs = json.load(f)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"error": f"Could not read session configs: {e}"}))
+        return
+    
+    # Diagnostics go to stderr; stdout only carries the NDJSON stream
+    output = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    for line in QuizSystem().generate_cohort(configs):
+        output.write(line)
+    output.flush()
+
+
+def compile_question_banks(quiz_types=None):
+    """Compile question bank CSVs into memory-mappable .qbank files"""
+    quiz_system = QuizSystem()
+    for quiz_type in quiz_types or quiz_system.quiz_types:
+        if quiz_type not in quiz_system.quiz_types:
+            print(f"Unknown quiz type: {quiz_type} (choose from {', '.join(quiz_system.quiz_types)})")
+            continue
+        csv_path = quiz_system.get_bank_path(quiz_type)
+        try:
+            started = time.perf_counter()
+            bank = compile_question_bank(csv_path)
+            elapsed = time.perf_counter() - started
+            print(f"Compiled {quiz_system.quiz_types[quiz_type]['name']}: {len(bank)} questions "
+                  f"-> {compiled_bank_path(csv_path)} ({elapsed:.2f}s)")
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            print(f"Error compiling {csv_path}: {e}")
 
 
 def main():
     """Main function to run the quiz system"""
-    # Check if running in API mode (with JSON config as argument)
-    if len(sys.argv) > 1:
+    global startup_profile_enabled
+    record_startup('module init', _module_init_started)
+    # --startup-profile works with every mode below
+    if '--startup-profile' in sys.argv:
+        sys.argv.remove('--startup-profile')
+        startup_profile_enabled = True
+    
+    # Long-lived worker mode: python backend-pycode.py --serve [--socket PATH]
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        socket_path = None
+        if '--socket' in sys.argv:
+            socket_path = sys.argv[sys.argv.index('--socket') + 1]
         try:
-            config_json = sys.argv[1]
+            serve(socket_path)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            write_behind.stop()
+    # Bulk cohort selection: python backend-pycode.py cohort [CONFIGS.json | -]
+    elif len(sys.argv) > 1 and sys.argv[1] == 'cohort':
+        run_cohort(sys.argv[2] if len(sys.argv) > 2 else None)
+        report_startup_profile()
+    # Pre-compile question banks: python backend-pycode.py compile-bank [QUIZ_TYPE ...]
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compile-bank':
+        compile_question_banks(sys.argv[2:])
+        report_startup_profile()
+    # Partition upkeep for cron: python backend-pycode.py partitions
+    elif len(sys.argv) > 1 and sys.argv[1] == 'partitions':
+        prepare_database()
+        report_startup_profile()
+    # HTTP service mode: python backend-pycode.py --http [HOST:]PORT [--workers N]
+    elif len(sys.argv) > 1 and sys.argv[1] == '--http':
+        address = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith('--') else '127.0.0.1:8000'
+        host, _, port = address.rpartition(':')
+        try:
+            if '--workers' in sys.argv:
+                workers = int(sys.argv[sys.argv.index('--workers') + 1])
+                run_prefork_http_service(host or '127.0.0.1', int(port), workers)
+            else:
+                run_http_service(host or '127.0.0.1', int(port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            write_behind.stop()
+    # Check if running in API mode (with JSON config as argument, or '-' to read it from stdin)
+    elif len(sys.argv) > 1:
+        try:
+            config_json = sys.stdin.read() if sys.argv[1] == '-' else sys.argv[1]
             quiz_system = QuizSystem()
+            started = time.perf_counter()
             result = quiz_system.api_mode(config_json)
+            record_startup('first request (includes bank load)', started)
             print(result)
         except Exception as e:
             print(json.dumps({"error": str(e)}))
+        report_startup_profile()
     else:
         # Original CLI mode
+        prepare_database()
+        report_startup_profile()
         quiz_system = QuizSystem()
         try:
             quiz_system.run_quiz()
@@ -619,338 +1521,240 @@ def main():
         except Exception as e:
             print(f"\nAn error occurred: {e}")
             print("Please contact system administrator.")
+        finally:
+            # Flush queued writes (or journal them if the database is down)
+            write_behind.stop()
 
 
-def insert_result_to_db(session_id, row, chosen_option, is_correct, time_taken, quiz_type):
-    try:
-        conn, success, error = get_db_connection()
-        if not success:
-            print("Database Error:", error)
-            return
-            
-        cursor = conn.cursor()
-        
-        # First check if the table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_name = 'quiz_results'
-            )
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            # Create the table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE quiz_results (
-                    id SERIAL PRIMARY KEY,
-                    session_id VARCHAR(100) NOT NULL,
-                    question TEXT NOT NULL,
-                    option_a TEXT NOT NULL,
-                    option_b TEXT NOT NULL,
-                    option_c TEXT NOT NULL,
-                    option_d TEXT NOT NULL,
-                    correct_option CHAR(1) NOT NULL,
-                    chosen_option CHAR(1),
-                    is_correct BOOLEAN,
-                    time_taken INTEGER,
-                    level VARCHAR(20) NOT NULL,
-                    domain VARCHAR(50) NOT NULL,
-                    skill VARCHAR(50) NOT NULL,
-                    quiz_type VARCHAR(20) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("Created quiz_results table")
-            
-            # Create indexes for better performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_session_id ON quiz_results(session_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_domain ON quiz_results(domain)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_level ON quiz_results(level)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_skill ON quiz_results(skill)")
-        else:
-            # Check if session_id column exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'quiz_results' AND column_name = 'session_id'
-                )
-            """)
-            column_exists = cursor.fetchone()[0]
-            
-            if not column_exists:
-                # Add session_id column if it doesn't exist
-                cursor.execute("ALTER TABLE quiz_results ADD COLUMN session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'")
-                print("Added session_id column to quiz_results table")
-                
-                # Create index for the new column
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_session_id ON quiz_results(session_id)")
-
-        cursor.execute("""
-            INSERT INTO quiz_results (
-                session_id, question, option_a, option_b, option_c, option_d,
-                correct_option, chosen_option, is_correct, time_taken,
-                level, domain, skill, quiz_type
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            session_id, row['question'], row['option_A'], row['option_B'], row['option_C'], row['option_D'],
-            row['correct_option'], chosen_option, is_correct, time_taken,
-            row['level'], row['domain'], row['skill'], quiz_type
-        ))
+QUIZ_RESULT_COLUMNS = ('session_id', 'question_id', 'chosen_option', 'is_correct', 'time_taken', 'quiz_type')
 
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print("Database Error:", e)
+QUESTION_COLUMNS = (
+    'question_id', 'quiz_type', 'question', 'option_a', 'option_b', 'option_c', 'option_d',
+    'correct_option', 'level', 'domain', 'skill', 'skills'
+)
 
+# Quizzes with at least this many answers are written with COPY instead of INSERT
+COPY_THRESHOLD = 200
 
-def insert_test_session(session_id, test_type, level, domain, question_count, time_limit):
-    try:
-        conn, success, error = get_db_connection()
-        if not success:
-            print("Database Error:", error)
-            return
-            
-        cursor = conn.cursor()
-        
-        # First check if the table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_name = 'test_sessions'
-            )
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            # Create the table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE test_sessions (
-                    session_id VARCHAR(100) PRIMARY KEY,
-                    test_type VARCHAR(20) NOT NULL,
-                    level VARCHAR(20) NOT NULL,
-                    domain VARCHAR(50) NOT NULL,
-                    question_count INTEGER NOT NULL,
-                    time_limit INTEGER NOT NULL,
-                    start_time TIMESTAMP NOT NULL,
-                    end_time TIMESTAMP,
-                    score INTEGER,
-                    total_time_taken INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("Created test_sessions table")
-            
-            # Create index for better performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_sessions_test_type ON test_sessions(test_type)")
-        else:
-            # Check if session_id column exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'test_sessions' AND column_name = 'session_id'
-                )
-            """)
-            column_exists = cursor.fetchone()[0]
-            
-            if not column_exists:
-                # Add session_id column if it doesn't exist
-                cursor.execute("ALTER TABLE test_sessions ADD COLUMN session_id VARCHAR(100) PRIMARY KEY DEFAULT 'legacy_session'")
-                print("Added session_id column to test_sessions table")
-
-        cursor.execute("""
-            INSERT INTO test_sessions (
-                session_id, test_type, level, domain, question_count, time_limit, start_time
-            ) VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-        """, (
-            session_id, test_type, level, domain, question_count, time_limit
-        ))
+# Questions per upsert statement when a bank is synced to the questions table
+QUESTION_SYNC_PAGE_SIZE = 1000
 
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print("Database Error:", e)
+# Format: {quiz_type: QuestionBank} - the bank version this process last synced
+synced_question_banks = {}
 
 
-def update_test_session(session_id, score, total_time_taken):
-    try:
-        conn, success, error = get_db_connection()
-        if not success:
-            print("Database Error:", error)
-            return
-            
-        cursor = conn.cursor()
-        
-        # First check if the table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_name = 'test_sessions'
-            )
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            print("Error: test_sessions table does not exist")
-            # Create the table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE test_sessions (
-                    session_id VARCHAR(100) PRIMARY KEY,
-                    test_type VARCHAR(20) NOT NULL,
-                    level VARCHAR(20) NOT NULL,
-                    domain VARCHAR(50) NOT NULL,
-                    question_count INTEGER NOT NULL,
-                    time_limit INTEGER NOT NULL,
-                    start_time TIMESTAMP NOT NULL,
-                    end_time TIMESTAMP,
-                    score INTEGER,
-                    total_time_taken INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("Created test_sessions table")
-            
-            # Create index for better performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_sessions_test_type ON test_sessions(test_type)")
-            return
-        else:
-            # Check if session_id column exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'test_sessions' AND column_name = 'session_id'
-                )
-            """)
-            column_exists = cursor.fetchone()[0]
-            
-            if not column_exists:
-                # Add session_id column if it doesn't exist
-                try:
-                    cursor.execute("ALTER TABLE test_sessions ADD COLUMN session_id VARCHAR(100) PRIMARY KEY DEFAULT 'legacy_session'")
-                    print("Added session_id column to test_sessions table")
-                except Exception as e:
-                    print(f"Error adding session_id column: {e}")
-                    # Try a different approach if the first one fails
-                    try:
-                        cursor.execute("ALTER TABLE test_sessions ADD COLUMN session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'")
-                        cursor.execute("ALTER TABLE test_sessions ADD PRIMARY KEY (session_id)")
-                        print("Added session_id column to test_sessions table (two-step approach)")
-                    except Exception as e2:
-                        print(f"Error in two-step approach: {e2}")
-                        return
-
-        # Now try to update the session
-        try:
-            cursor.execute("""
-                UPDATE test_sessions 
-                SET end_time = CURRENT_TIMESTAMP, score = %s, total_time_taken = %s 
-                WHERE session_id = %s
-            """, (
-                score, total_time_taken, session_id
-            ))
+def quiz_result_values(session_id, row, chosen_option, is_correct, time_taken, quiz_type):
+    """Build the quiz_results column values for one answer"""
+    return (session_id, row['id'], chosen_option, is_correct, time_taken, quiz_type)
+
+
+def question_values(quiz_type, row):
+    """Build the questions column values for one bank question"""
+    # Banks may spell the option columns option_a or option_A
+    options = [row.get(f'option_{letter}', row.get(f'option_{letter.upper()}')) for letter in 'abcd']
+    return (
+        row['id'], quiz_type, row['question'], *options, row['correct_option'],
+        row.get('level'), row.get('domain'), row.get('skill'), row.get('skills')
+    )
+
+
+def write_rows(cursor, table, columns, rows):
+    """Write rows with one multi-row statement (COPY for large batches)"""
+    from psycopg2.extras import execute_values
+    if len(rows) >= COPY_THRESHOLD:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows)
+
+
+def question_bank_digest(bank):
+    """Digest of a bank's content (its JSON fragments hold every column and the ID)"""
+    return hashlib.blake2b(bank.fragment_blob, digest_size=16).hexdigest()
+
 
-            conn.commit()
+def sync_question_bank(cursor, quiz_type, bank):
+    """Upsert one bank into the questions table unless it is already synced; returns True if it wrote"""
+    from psycopg2.extras import execute_values
+    digest = question_bank_digest(bank)
+    cursor.execute("SELECT bank_digest FROM question_sync_state WHERE quiz_type = %s", (quiz_type,))
+    synced = cursor.fetchone()
+    if synced and synced[0] == digest:
+        return False
+
+    updated = [column for column in QUESTION_COLUMNS if column != 'question_id']
+    # ON CONFLICT DO UPDATE can't touch a row twice in one statement, so never send an ID twice
+    seen_ids = set()
+    rows = (
+        question_values(quiz_type, row) for row in bank
+        if row['id'] not in seen_ids and not seen_ids.add(row['id'])
+    )
+    # Rows whose content didn't change are matched but not rewritten
+    execute_values(cursor, f"""
+        INSERT INTO questions ({', '.join(QUESTION_COLUMNS)}) VALUES %s
+        ON CONFLICT (question_id) DO UPDATE
+        SET {', '.join(f'{column} = EXCLUDED.{column}' for column in updated)}, updated_at = CURRENT_TIMESTAMP
+        WHERE ({', '.join(f'questions.{column}' for column in updated)})
+            IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in updated)})
+    """, rows, page_size=QUESTION_SYNC_PAGE_SIZE)
+    cursor.execute("""
+        INSERT INTO question_sync_state (quiz_type, bank_digest, question_count, synced_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (quiz_type) DO UPDATE
+        SET bank_digest = EXCLUDED.bank_digest, question_count = EXCLUDED.question_count, synced_at = EXCLUDED.synced_at
+    """, (quiz_type, digest, len(bank)))
+    return True
+
+
+@timed('db.sync_question_banks')
+def sync_question_banks():
+    """Sync every loaded bank this process hasn't synced since it was (re)loaded.
+
+    Answers only store question IDs, so the questions table must know every
+    question that can be answered. Each bank version is checked once per
+    process; banks whose digest matches question_sync_state aren't rewritten.
+    """
+    pending = {
+        quiz_type: bank for quiz_type, bank in question_bank_cache.banks().items()
+        if synced_question_banks.get(quiz_type) is not bank
+    }
+    if not pending:
+        return
+    try:
+        ensure_schema(db_pool)
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            for quiz_type, bank in pending.items():
+                if sync_question_bank(cursor, quiz_type, bank):
+                    print(f"Synced {len(bank)} questions for quiz type {quiz_type}", file=sys.stderr)
+                conn.commit()
+                synced_question_banks[quiz_type] = bank
             cursor.close()
-            conn.close()
-        except Exception as e:
-            print(f"Error updating test session: {e}")
     except Exception as e:
-        print("Database Error:", e)
+        metrics.record_error('db.sync_question_banks')
+        print("Database Error:", e, file=sys.stderr)
 
 
-def insert_test_results(session_id, score, correct_answers, total_questions, time_taken, strengths, weaknesses, recommendations):
-    try:
-        conn, success, error = get_db_connection()
-        if not success:
-            print("Database Error:", error)
-            return
-            
-        cursor = conn.cursor()
-        
-        # First check if the table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_name = 'test_results'
-            )
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            # Create the table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE test_results (
-                    id SERIAL PRIMARY KEY,
-                    session_id VARCHAR(100) NOT NULL,
-                    score INTEGER NOT NULL,
-                    correct_answers INTEGER NOT NULL,
-                    total_questions INTEGER NOT NULL,
-                    time_taken INTEGER NOT NULL,
-                    strengths TEXT[],
-                    weaknesses TEXT[],
-                    recommendations TEXT[],
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("Created test_results table")
-            
-            # Add foreign key if test_sessions table exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' AND table_name = 'test_sessions'
-                )
-            """)
-            if cursor.fetchone()[0]:
-                try:
-                    cursor.execute("""
-                        ALTER TABLE test_results
-                        ADD CONSTRAINT fk_test_results_session_id
-                        FOREIGN KEY (session_id) REFERENCES test_sessions(session_id)
-                    """)
-                    print("Added foreign key constraint to test_results table")
-                except Exception as e:
-                    print(f"Warning: Could not add foreign key constraint: {e}")
-        else:
-            # Check if session_id column exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'test_results' AND column_name = 'session_id'
-                )
-            """)
-            column_exists = cursor.fetchone()[0]
-            
-            if not column_exists:
-                # Add session_id column if it doesn't exist
-                cursor.execute("ALTER TABLE test_results ADD COLUMN session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'")
-                print("Added session_id column to test_results table")
-                
-                # Try to add foreign key constraint
-                try:
-                    cursor.execute("""
-                        ALTER TABLE test_results
-                        ADD CONSTRAINT fk_test_results_session_id
-                        FOREIGN KEY (session_id) REFERENCES test_sessions(session_id)
-                    """)
-                    print("Added foreign key constraint to test_results table")
-                except Exception as e:
-                    print(f"Warning: Could not add foreign key constraint: {e}")
+@timed('db.write_pending_records')
+def write_pending_records(records):
+    """Write a batch of write-behind records in one transaction.
 
-        cursor.execute("""
-            INSERT INTO test_results (session_id, score, correct_answers, total_questions, time_taken, strengths, weaknesses, recommendations)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            session_id, score, correct_answers, total_questions, time_taken, strengths, weaknesses, recommendations
-        ))
+    Sessions are written before answers and results so foreign keys hold within
+    the batch. Errors propagate so the write-behind queue can journal the batch.
+    """
+    sessions = []
+    answer_rows = []
+    session_scores = []
+    results = []
+    for record in records:
+        payload = record['payload']
+        if record['kind'] == 'test_session':
+            sessions.append((
+                payload['session_id'], payload['test_type'], payload['level'], payload['domain'],
+                payload['question_count'], payload['time_limit'], payload['start_time']
+            ))
+        elif record['kind'] == 'quiz_results':
+            answer_rows.extend(tuple(row) for row in payload['rows'])
+            if payload.get('score') is not None:
+                session_scores.append((
+                    payload['session_id'], payload['score'], payload['total_time_taken'], payload['end_time']
+                ))
+        elif record['kind'] == 'test_results':
+            results.append((
+                payload['session_id'], payload['score'], payload['correct_answers'], payload['total_questions'],
+                payload['time_taken'], payload['strengths'], payload['weaknesses'], payload['recommendations']
+            ))
+        else:
+            print(f"Skipping unknown write-behind record: {record['kind']}", file=sys.stderr)
 
+    from psycopg2.extras import execute_values
+    ensure_schema(db_pool)
+    if answer_rows:
+        # Answers reference questions by ID; make sure reloaded banks are in the table
+        sync_question_banks()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        if sessions:
+            execute_values(cursor, """
+                INSERT INTO test_sessions (
+                    session_id, test_type, level, domain, question_count, time_limit, start_time
+                ) VALUES %s
+                ON CONFLICT (session_id) DO NOTHING
+            """, sessions)
+        if answer_rows:
+            write_rows(cursor, 'quiz_results', QUIZ_RESULT_COLUMNS, answer_rows)
+        if session_scores:
+            execute_values(cursor, """
+                UPDATE test_sessions AS s
+                SET end_time = v.end_time::timestamp, score = v.score, total_time_taken = v.total_time_taken
+                FROM (VALUES %s) AS v(session_id, score, total_time_taken, end_time)
+                WHERE s.session_id = v.session_id
+            """, session_scores)
+        if results:
+            execute_values(cursor, """
+                INSERT INTO test_results (session_id, score, correct_answers, total_questions, time_taken, strengths, weaknesses, recommendations)
+                VALUES %s
+            """, results)
         conn.commit()
         cursor.close()
-        conn.close()
-    except Exception as e:
-        print("Database Error:", e)
+
+
+def is_rejected_write(error):
+    """True if the database refused the records themselves rather than being unreachable"""
+    import psycopg2
+    return isinstance(error, (psycopg2.IntegrityError, psycopg2.DataError))
+
+
+# Background writer for everything the quiz flow persists
+write_behind = WriteBehindQueue(
+    write_pending_records,
+    os.environ.get('QUIZ_WRITE_JOURNAL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quiz_writes.journal')),
+    max_size=int(os.environ.get('QUIZ_WRITE_QUEUE_SIZE', 10000)),
+    is_rejected=is_rejected_write
+)
+
+
+def queue_test_session(session_id, test_type, level, domain, question_count, time_limit):
+    """Queue a test_sessions row for the background writer"""
+    write_behind.put('test_session', {
+        'session_id': session_id,
+        'test_type': test_type,
+        'level': level,
+        'domain': domain,
+        'question_count': question_count,
+        'time_limit': time_limit,
+        'start_time': datetime.now().isoformat()
+    })
+
+
+def queue_quiz_results(session_id, answers, quiz_type, score=None, total_time_taken=None):
+    """Queue all answers of a quiz (and optionally the session score) for the background writer"""
+    write_behind.put('quiz_results', {
+        'session_id': session_id,
+        'rows': [
+            quiz_result_values(session_id, row, chosen_option, is_correct, time_taken, quiz_type)
+            for row, chosen_option, is_correct, time_taken in answers
+        ],
+        'score': score,
+        'total_time_taken': total_time_taken,
+        'end_time': datetime.now().isoformat()
+    })
+
+
+def queue_test_results(session_id, score, correct_answers, total_questions, time_taken, strengths, weaknesses, recommendations):
+    """Queue a test_results row for the background writer"""
+    write_behind.put('test_results', {
+        'session_id': session_id,
+        'score': score,
+        'correct_answers': correct_answers,
+        'total_questions': total_questions,
+        'time_taken': time_taken,
+        'strengths': strengths,
+        'weaknesses': weaknesses,
+        'recommendations': recommendations
+    })
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from question_bank import (
+    QuestionBank, compile_question_bank, compiled_bank_path, encode_questions, open_compiled_bank,
+    question_bank_cache
+)
+from recency_store import InMemoryRecencyStore
+
+# Benchmark the quiz pipeline stages (load, filter, select, serialize and
+# end-to-end api_mode) on synthetic question banks, cold and warm, with peak
+# memory, and write the results as JSON so releases can be compared.
+#
+# Usage: python benchmark.py [--sizes 1000,100000,1000000] [--repeat N] [--output FILE]
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_REPEAT = 20
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# Roughly the shape of the real banks: most questions are beginner/intermediate,
+# a few domains hold most of the questions, and skills lists name 1-4 skills
+LEVELS = (('Beginner', 0.4), ('Intermediate', 0.4), ('Advanced', 0.2))
+DOMAINS = (
+    ('webdev', 0.22), ('python', 0.18), ('database', 0.12), ('programming', 0.12),
+    ('machine_learning', 0.1), ('cloud_computing', 0.08), ('devops', 0.07),
+    ('cybersecurity', 0.06), ('networking', 0.05)
+)
+SKILLS = {
+    'webdev': ('HTML', 'CSS', 'JavaScript', 'React', 'REST'),
+    'python': ('Python', 'Django', 'Flask', 'Pandas'),
+    'database': ('SQL', 'PostgreSQL', 'Indexing', 'Transactions'),
+    'programming': ('Algorithms', 'Data Structures', 'OOP', 'Testing'),
+    'machine_learning': ('Machine_Learning', 'Statistics', 'Python', 'Deep Learning'),
+    'cloud_computing': ('AWS', 'Cloud_Computing', 'Docker', 'Kubernetes'),
+    'devops': ('DevOps', 'CI/CD', 'Docker', 'Linux'),
+    'cybersecurity': ('Cybersecurity', 'Cryptography', 'Networking'),
+    'networking': ('Networking', 'TCP/IP', 'DNS', 'Linux'),
+}
+WORDS = ('which', 'of', 'the', 'following', 'is', 'a', 'best', 'way', 'to', 'handle', 'data', 'request',
+         'query', 'index', 'value', 'function', 'system', 'error', 'user', 'server', 'cache', 'model')
+
+# The selection every stage benchmark uses
+BENCHMARK_CONFIG = {'quiz_type': '2', 'num_questions': 10, 'level': 'Intermediate', 'domain': 'python'}
+
+
+def load_quiz_module():
+    """Import backend-pycode.py (its name isn't a valid module name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend-pycode.py')
+    spec = importlib.util.spec_from_file_location('quiz_backend', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_bank(path, rows, seed=0):
+    """Write a synthetic technical skills CSV with rows questions"""
+    rng = random.Random(seed)
+    levels, level_weights = zip(*LEVELS)
+    domains, domain_weights = zip(*DOMAINS)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['question', 'option_a', 'option_b', 'option_c', 'option_d',
+                         'correct_option', 'level', 'domain', 'skill', 'skills'])
+        for i in range(rows):
+            domain = rng.choices(domains, domain_weights)[0]
+            skills = rng.sample(SKILLS[domain], rng.randint(1, min(4, len(SKILLS[domain]))))
+            question = ' '.join(rng.choices(WORDS, k=rng.randint(6, 30))).capitalize()
+            options = [' '.join(rng.choices(WORDS, k=rng.randint(1, 8))) for _ in range(4)]
+            writer.writerow([f"{question} (#{i})?", *options, rng.choice('ABCD'),
+                             rng.choices(levels, level_weights)[0], domain, skills[0], ', '.join(skills)])
+
+
+def measure(function, repeat, reset=None):
+    """Time function cold (after reset) and warm, then once more under tracemalloc.
+
+    Returns {'cold_ms', 'warm_min_ms', 'warm_median_ms', 'warm_p95_ms', 'peak_memory_kb'}
+    and the result of the cold call.
+    """
+    if reset:
+        reset()
+    started = time.perf_counter()
+    result = function()
+    cold = time.perf_counter() - started
+
+    warm = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        warm.append(time.perf_counter() - started)
+    warm.sort()
+
+    # Separate run: tracemalloc slows allocation-heavy code too much to time under it
+    if reset:
+        reset()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = {
+        'cold_ms': round(cold * 1000, 3),
+        'warm_min_ms': round(warm[0] * 1000, 3) if warm else None,
+        'warm_median_ms': round(statistics.median(warm) * 1000, 3) if warm else None,
+        'warm_p95_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.95))] * 1000, 3) if warm else None,
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+    return timings, result
+
+
+def benchmark_size(quiz_module, rows, repeat, work_dir):
+    """Run every stage benchmark on one synthetic bank size"""
+    csv_path = os.path.join(work_dir, f'technical_skills_{rows}.csv')
+    started = time.perf_counter()
+    generate_bank(csv_path, rows)
+    generate_seconds = time.perf_counter() - started
+    print(f"{rows} rows: generated in {generate_seconds:.1f}s", file=sys.stderr)
+
+    quiz_system = quiz_module.QuizSystem()
+    quiz_system.api_mode_active = True
+    quiz_system.quiz_types = {'2': {'name': 'Technical Skills', 'file': csv_path}}
+    quiz_system.current_quiz = 'Technical Skills'
+    # Selection must not see recency left over from other sizes
+    quiz_module.QuizSystem.recency_store = InMemoryRecencyStore(quiz_module.QuizSystem.QUESTION_COOLDOWN)
+    config = dict(BENCHMARK_CONFIG)
+    # Large banks are slow to build; don't repeat the one-off stages as often
+    load_repeat = repeat if rows <= 10000 else max(1, repeat * 10000 // rows)
+    stages = {}
+
+    stages['load_csv'], question_rows = measure(lambda: quiz_system.load_csv_data(csv_path), load_repeat)
+    stages['build_bank'], bank = measure(lambda: QuestionBank(question_rows), load_repeat)
+    del question_rows
+
+    compiled_path = compiled_bank_path(csv_path)
+    stages['compile_bank'], _ = measure(lambda: compile_question_bank(csv_path), min(load_repeat, 3))
+    stages['open_compiled_bank'], _ = measure(lambda: open_compiled_bank(compiled_path, csv_path), repeat)
+
+    def reset_filters():
+        bank._candidates.clear()
+        bank._domain_ids.clear()
+    stages['filter'], filtered = measure(
+        lambda: quiz_system.filter_questions(bank, config, '2'), repeat, reset_filters
+    )
+
+    session_ids = (f'bench_{i}' for i in range(10 ** 9))
+    stages['select'], selected = measure(
+        lambda: quiz_system.select_random_questions(filtered, config['num_questions'], next(session_ids)), repeat
+    )
+    stages['serialize'], _ = measure(lambda: encode_questions(selected), repeat)
+    stages['serialize_json_dumps'], _ = measure(lambda: json.dumps([q.to_dict() for q in selected]), repeat)
+
+    def api_request():
+        with contextlib.redirect_stderr(io.StringIO()):
+            return quiz_system.api_mode(dict(config, session_id=next(session_ids)))
+
+    # Cold end-to-end: nothing cached, bank parsed from CSV (then from the compiled file)
+    os.remove(compiled_path)
+    stages['api_mode_csv'], _ = measure(api_request, repeat, question_bank_cache.clear)
+    compile_question_bank(csv_path)
+    stages['api_mode_compiled'], _ = measure(api_request, repeat, question_bank_cache.clear)
+    question_bank_cache.clear()
+    os.remove(compiled_path)
+    os.remove(csv_path)
+
+    return {
+        'rows': rows,
+        'generate_seconds': round(generate_seconds, 3),
+        'filtered_questions': len(filtered),
+        'stages': stages
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run the benchmarks and write the results file"""
+    sizes = DEFAULT_SIZES
+    repeat = DEFAULT_REPEAT
+    output = DEFAULT_OUTPUT
+    args = sys.argv[1:]
+    if '--sizes' in args:
+        sizes = [int(size) for size in args[args.index('--sizes') + 1].split(',')]
+    if '--repeat' in args:
+        repeat = int(args[args.index('--repeat') + 1])
+    if '--output' in args:
+        output = args[args.index('--output') + 1]
+
+    quiz_module = load_quiz_module()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='quiz-bench-') as work_dir:
+        for rows in sizes:
+            results.append(benchmark_size(quiz_module, rows, repeat, work_dir))
+            for stage, timings in results[-1]['stages'].items():
+                print(f"  {stage:22} cold {timings['cold_ms']:>10.3f} ms   warm median "
+                      f"{timings['warm_median_ms'] or 0:>10.3f} ms   peak {timings['peak_memory_kb']:>10.1f} KiB",
+                      file=sys.stderr)
+
+    # Format: {"generated_at": ..., "commit": ..., "python": ..., "results": [{"rows": N, "stages": {...}}]}
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'config': BENCHMARK_CONFIG,
+        'results': results
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
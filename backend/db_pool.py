@@ -0,0 +1,148 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DBPoolError(Exception):
+    """Raised when the pool cannot hand out a connection"""
+
+
+class DBConnectionPool:
+    """Thread-safe pool of database connections shared by the DB helpers.
+
+    connection_factory has the db_config.get_db_connection signature and returns
+    (conn, success, error). Connections are opened lazily up to max_size; callers
+    wait up to timeout seconds for one to be released before DBPoolError is raised.
+    """
+
+    def __init__(self, connection_factory, max_size=5, timeout=10.0):
+        self.connection_factory = connection_factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+        # Utilization metrics
+        self.created = 0
+        self.acquisitions = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.total_wait_time = 0.0
+        self.peak_in_use = 0
+
+    def acquire(self):
+        """Take a connection from the pool, opening a new one if there is room"""
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        self._size -= 1
+                        self.discarded += 1
+                        continue
+                    self._checked_out(started, waited)
+                    return conn
+                if self._size < self.max_size:
+                    # Reserve the slot, then connect outside the lock
+                    self._size += 1
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise DBPoolError(f"Timed out after {self.timeout}s waiting for a database connection")
+                waited = True
+                self._condition.wait(remaining)
+
+        try:
+            conn, success, error = self.connection_factory()
+        except Exception as e:
+            conn, success, error = None, False, e
+        if not success:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise DBPoolError(error)
+
+        with self._condition:
+            self.created += 1
+            self._checked_out(started, waited)
+        return conn
+
+    def _checked_out(self, started, waited):
+        self.acquisitions += 1
+        self._in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self._in_use)
+        if waited:
+            self.waits += 1
+            self.total_wait_time += time.perf_counter() - started
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool; broken or discarded ones are closed"""
+        if not discard and not conn.closed:
+            try:
+                # Drop anything the caller left uncommitted
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._size -= 1
+                self.discarded += 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+
+        if discard:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close when released)"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """Return pool size and utilization metrics"""
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'utilization': self._in_use / self.max_size if self.max_size else 0,
+                'peak_in_use': self.peak_in_use,
+                'created': self.created,
+                'acquisitions': self.acquisitions,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'avg_wait_ms': (self.total_wait_time / self.waits * 1000) if self.waits else 0.0
+            }
@@ -0,0 +1,459 @@
+import re
+import sys
+import threading
+from datetime import date
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate one at a time
+MIGRATION_LOCK_KEY = 7346512
+
+# Tables range-partitioned by month on created_at (migration 3)
+PARTITIONED_TABLES = ('quiz_results', 'test_results')
+
+# Monthly partitions are kept created this many months past the current one
+PARTITION_MONTHS_AHEAD = 3
+
+# Ordered, append-only list of (version, description, statements). A statement is
+# SQL, or a callable taking the cursor for steps that need to look at the data.
+# Never edit a released migration; add a new version instead.
+SCHEMA_MIGRATIONS = [
+    (1, "quiz_results, test_sessions and test_results tables", [
+        """
+        CREATE TABLE IF NOT EXISTS quiz_results (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(100) NOT NULL,
+            question TEXT NOT NULL,
+            option_a TEXT NOT NULL,
+            option_b TEXT NOT NULL,
+            option_c TEXT NOT NULL,
+            option_d TEXT NOT NULL,
+            correct_option CHAR(1) NOT NULL,
+            chosen_option CHAR(1),
+            is_correct BOOLEAN,
+            time_taken INTEGER,
+            level VARCHAR(20) NOT NULL,
+            domain VARCHAR(50) NOT NULL,
+            skill VARCHAR(50) NOT NULL,
+            quiz_type VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Tables created before sessions were tracked
+        "ALTER TABLE quiz_results ADD COLUMN IF NOT EXISTS session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_results_session_id ON quiz_results(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_results_domain ON quiz_results(domain)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_results_level ON quiz_results(level)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_results_skill ON quiz_results(skill)",
+        """
+        CREATE TABLE IF NOT EXISTS test_sessions (
+            session_id VARCHAR(100) PRIMARY KEY,
+            test_type VARCHAR(20) NOT NULL,
+            level VARCHAR(20) NOT NULL,
+            domain VARCHAR(50) NOT NULL,
+            question_count INTEGER NOT NULL,
+            time_limit INTEGER NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP,
+            score INTEGER,
+            total_time_taken INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'",
+        "CREATE INDEX IF NOT EXISTS idx_test_sessions_test_type ON test_sessions(test_type)",
+        """
+        CREATE TABLE IF NOT EXISTS test_results (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(100) NOT NULL,
+            score INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            time_taken INTEGER NOT NULL,
+            strengths TEXT[],
+            weaknesses TEXT[],
+            recommendations TEXT[],
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE test_results ADD COLUMN IF NOT EXISTS session_id VARCHAR(100) NOT NULL DEFAULT 'legacy_session'",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_test_results_session_id') THEN
+                ALTER TABLE test_results
+                ADD CONSTRAINT fk_test_results_session_id
+                FOREIGN KEY (session_id) REFERENCES test_sessions(session_id);
+            END IF;
+        EXCEPTION WHEN others THEN
+            RAISE NOTICE 'Could not add foreign key constraint: %', SQLERRM;
+        END $$
+        """,
+    ]),
+    (2, "normalized questions table; quiz_results references questions by ID", [
+        # One row per bank question, keyed by the stable question ID and upserted
+        # from the loaded banks. Questions dropped from a bank stay for old answers.
+        """
+        CREATE TABLE IF NOT EXISTS questions (
+            question_id BIGINT PRIMARY KEY,
+            quiz_type VARCHAR(20) NOT NULL,
+            question TEXT NOT NULL,
+            option_a TEXT,
+            option_b TEXT,
+            option_c TEXT,
+            option_d TEXT,
+            correct_option CHAR(1) NOT NULL,
+            level VARCHAR(20),
+            domain VARCHAR(50),
+            skill VARCHAR(50),
+            skills TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_questions_quiz_type_level ON questions(quiz_type, level)",
+        "CREATE INDEX IF NOT EXISTS idx_questions_domain ON questions(domain)",
+        # Digest of each bank as last synced, so unchanged banks aren't re-upserted
+        """
+        CREATE TABLE IF NOT EXISTS question_sync_state (
+            quiz_type VARCHAR(20) PRIMARY KEY,
+            bank_digest VARCHAR(64) NOT NULL,
+            question_count INTEGER NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # New answers carry only the question ID; rows written before this keep
+        # their copied text, so the text columns become nullable instead of dropped
+        "ALTER TABLE quiz_results ADD COLUMN IF NOT EXISTS question_id BIGINT",
+        """
+        ALTER TABLE quiz_results
+            ALTER COLUMN question DROP NOT NULL,
+            ALTER COLUMN option_a DROP NOT NULL,
+            ALTER COLUMN option_b DROP NOT NULL,
+            ALTER COLUMN option_c DROP NOT NULL,
+            ALTER COLUMN option_d DROP NOT NULL,
+            ALTER COLUMN correct_option DROP NOT NULL,
+            ALTER COLUMN level DROP NOT NULL,
+            ALTER COLUMN domain DROP NOT NULL,
+            ALTER COLUMN skill DROP NOT NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_quiz_results_question_id ON quiz_results(question_id)",
+        # Level/domain/skill are looked up through questions now
+        "DROP INDEX IF EXISTS idx_quiz_results_domain",
+        "DROP INDEX IF EXISTS idx_quiz_results_level",
+        "DROP INDEX IF EXISTS idx_quiz_results_skill",
+        # Old and new answers in the old wide shape, for reports
+        """
+        CREATE OR REPLACE VIEW quiz_results_detailed AS
+        SELECT
+            r.id, r.session_id, r.question_id,
+            COALESCE(q.question, r.question) AS question,
+            COALESCE(q.option_a, r.option_a) AS option_a,
+            COALESCE(q.option_b, r.option_b) AS option_b,
+            COALESCE(q.option_c, r.option_c) AS option_c,
+            COALESCE(q.option_d, r.option_d) AS option_d,
+            COALESCE(q.correct_option, r.correct_option) AS correct_option,
+            r.chosen_option, r.is_correct, r.time_taken,
+            COALESCE(q.level, r.level) AS level,
+            COALESCE(q.domain, r.domain) AS domain,
+            COALESCE(q.skill, r.skill) AS skill,
+            r.quiz_type, r.created_at
+        FROM quiz_results r
+        LEFT JOIN questions q ON q.question_id = r.question_id
+        """,
+    ]),
+    (3, "quiz_results and test_results partitioned by month on created_at", [
+        # The view is bound to the old table; it is recreated over the new one below
+        "DROP VIEW IF EXISTS quiz_results_detailed",
+        "ALTER TABLE quiz_results RENAME TO quiz_results_unpartitioned",
+        "DROP INDEX IF EXISTS idx_quiz_results_session_id",
+        "DROP INDEX IF EXISTS idx_quiz_results_question_id",
+        # created_at must be part of the key of a table partitioned on it
+        """
+        CREATE TABLE quiz_results (
+            id BIGINT NOT NULL DEFAULT nextval('quiz_results_id_seq'),
+            session_id VARCHAR(100) NOT NULL,
+            question_id BIGINT,
+            question TEXT,
+            option_a TEXT,
+            option_b TEXT,
+            option_c TEXT,
+            option_d TEXT,
+            correct_option CHAR(1),
+            chosen_option CHAR(1),
+            is_correct BOOLEAN,
+            time_taken INTEGER,
+            level VARCHAR(20),
+            domain VARCHAR(50),
+            skill VARCHAR(50),
+            quiz_type VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT quiz_results_partitioned_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        # IDs carry on from the old table, which would otherwise drop the sequence with it
+        "ALTER SEQUENCE quiz_results_id_seq AS BIGINT OWNED BY quiz_results.id",
+        # Catches rows outside every monthly partition if maintenance falls behind
+        "CREATE TABLE quiz_results_default PARTITION OF quiz_results DEFAULT",
+        # BRIN on time stays tiny because rows arrive in created_at order
+        "CREATE INDEX idx_quiz_results_created_at ON quiz_results USING brin (created_at)",
+        "CREATE INDEX idx_quiz_results_session_id ON quiz_results(session_id)",
+        "CREATE INDEX idx_quiz_results_question_id ON quiz_results(question_id)",
+        lambda cursor: create_history_partitions(cursor, 'quiz_results'),
+        """
+        INSERT INTO quiz_results (
+            id, session_id, question_id, question, option_a, option_b, option_c, option_d,
+            correct_option, chosen_option, is_correct, time_taken, level, domain, skill, quiz_type, created_at
+        )
+        SELECT
+            id, session_id, question_id, question, option_a, option_b, option_c, option_d,
+            correct_option, chosen_option, is_correct, time_taken, level, domain, skill, quiz_type,
+            COALESCE(created_at, LOCALTIMESTAMP)
+        FROM quiz_results_unpartitioned
+        """,
+        "DROP TABLE quiz_results_unpartitioned",
+        """
+        CREATE OR REPLACE VIEW quiz_results_detailed AS
+        SELECT
+            r.id, r.session_id, r.question_id,
+            COALESCE(q.question, r.question) AS question,
+            COALESCE(q.option_a, r.option_a) AS option_a,
+            COALESCE(q.option_b, r.option_b) AS option_b,
+            COALESCE(q.option_c, r.option_c) AS option_c,
+            COALESCE(q.option_d, r.option_d) AS option_d,
+            COALESCE(q.correct_option, r.correct_option) AS correct_option,
+            r.chosen_option, r.is_correct, r.time_taken,
+            COALESCE(q.level, r.level) AS level,
+            COALESCE(q.domain, r.domain) AS domain,
+            COALESCE(q.skill, r.skill) AS skill,
+            r.quiz_type, r.created_at
+        FROM quiz_results r
+        LEFT JOIN questions q ON q.question_id = r.question_id
+        """,
+        "ALTER TABLE test_results RENAME TO test_results_unpartitioned",
+        """
+        CREATE TABLE test_results (
+            id BIGINT NOT NULL DEFAULT nextval('test_results_id_seq'),
+            session_id VARCHAR(100) NOT NULL,
+            score INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            time_taken INTEGER NOT NULL,
+            strengths TEXT[],
+            weaknesses TEXT[],
+            recommendations TEXT[],
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT test_results_partitioned_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "ALTER SEQUENCE test_results_id_seq AS BIGINT OWNED BY test_results.id",
+        "CREATE TABLE test_results_default PARTITION OF test_results DEFAULT",
+        "CREATE INDEX idx_test_results_created_at ON test_results USING brin (created_at)",
+        lambda cursor: create_history_partitions(cursor, 'test_results'),
+        """
+        INSERT INTO test_results (
+            id, session_id, score, correct_answers, total_questions, time_taken,
+            strengths, weaknesses, recommendations, created_at
+        )
+        SELECT
+            id, session_id, score, correct_answers, total_questions, time_taken,
+            strengths, weaknesses, recommendations, COALESCE(created_at, LOCALTIMESTAMP)
+        FROM test_results_unpartitioned
+        """,
+        "DROP TABLE test_results_unpartitioned",
+        """
+        DO $$
+        BEGIN
+            ALTER TABLE test_results
+            ADD CONSTRAINT fk_test_results_session_id
+            FOREIGN KEY (session_id) REFERENCES test_sessions(session_id);
+        EXCEPTION WHEN others THEN
+            RAISE NOTICE 'Could not add foreign key constraint: %', SQLERRM;
+        END $$
+        """,
+    ]),
+    (4, "recently_used_questions table for the shared recency store", [
+        """
+        CREATE TABLE IF NOT EXISTS recently_used_questions (
+            quiz_type VARCHAR(20) NOT NULL,
+            question_id BIGINT NOT NULL,
+            used_at DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (quiz_type, question_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recently_used_questions_used_at ON recently_used_questions(used_at)",
+    ]),
+]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def get_schema_version(cursor):
+    """Return the highest applied migration version (0 for a fresh database)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def run_migrations(pool):
+    """Apply every pending migration, each in its own transaction, and return the schema version"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        version = 0
+        for migration_version, description, statements in SCHEMA_MIGRATIONS:
+            # Serialize against other workers starting at the same time
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            version = get_schema_version(cursor)
+            if migration_version <= version:
+                conn.commit()
+                continue
+
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (migration_version, description)
+            )
+            conn.commit()
+            version = migration_version
+            print(f"Applied schema migration {migration_version}: {description}", file=sys.stderr)
+        cursor.close()
+        return version
+
+
+def ensure_schema(pool):
+    """Run the migrations once per process; later calls are a flag check"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            run_migrations(pool)
+            _schema_ready = True
+
+
+def add_months(month, count):
+    """Return the first day of the month count months after month (a date)"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+
+def current_month(cursor):
+    """First day of the current month by the database clock (created_at defaults to it)"""
+    cursor.execute("SELECT date_trunc('month', LOCALTIMESTAMP)::date")
+    return cursor.fetchone()[0]
+
+
+def create_month_partition(cursor, table, month):
+    """Create and attach the partition of table for month; returns False if it exists.
+
+    Rows that already landed in the default partition for that month are moved
+    into the new partition first, since attaching it would fail otherwise.
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    if cursor.fetchone()[0] is not None:
+        return False
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    return True
+
+
+def create_partitions(cursor, table, first_month, last_month):
+    """Create the monthly partitions of table from first_month through last_month"""
+    created = []
+    month = first_month
+    while month <= last_month:
+        if create_month_partition(cursor, table, month):
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def create_history_partitions(cursor, table):
+    """Migration 3 step: partitions for every month of the old table's rows, plus the months ahead"""
+    this_month = current_month(cursor)
+    cursor.execute(f"SELECT date_trunc('month', MIN(created_at))::date FROM {table}_unpartitioned")
+    oldest = cursor.fetchone()[0]
+    create_partitions(cursor, table, min(oldest or this_month, this_month), add_months(this_month, PARTITION_MONTHS_AHEAD))
+
+
+def month_partitions(cursor, table):
+    """Return [(partition name, first day of its month)] for table's monthly partitions"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    pattern = re.compile(rf'^{table}_(\d{{4}})_(\d{{2}})$')
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(pool, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create any missing monthly partitions up to months_ahead; returns the names created"""
+    created = []
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        # Serialize against migrations and other workers doing the same
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        this_month = current_month(cursor)
+        for table in PARTITIONED_TABLES:
+            created += create_partitions(cursor, table, this_month, add_months(this_month, months_ahead))
+        conn.commit()
+        cursor.close()
+    return created
+
+
+def apply_retention(pool, keep_months, archive_schema=None):
+    """Remove monthly partitions older than keep_months before the current month.
+
+    Expired partitions are dropped, or with archive_schema detached and moved
+    into that schema, where they can be dumped and dropped later. Whole
+    partitions go at once, so nothing is deleted row by row or left to vacuum.
+    Returns the names of the partitions removed.
+    """
+    if archive_schema is not None and not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', archive_schema):
+        raise ValueError(f"Invalid archive schema name: {archive_schema!r}")
+    removed = []
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cutoff = add_months(current_month(cursor), -keep_months)
+        if archive_schema:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        for table in PARTITIONED_TABLES:
+            for name, month in month_partitions(cursor, table):
+                if month >= cutoff:
+                    break
+                if archive_schema:
+                    cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                    cursor.execute(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+                else:
+                    cursor.execute(f"DROP TABLE {name}")
+                removed.append(name)
+        conn.commit()
+        cursor.close()
+    return removed
@@ -0,0 +1,132 @@
+from metrics import timed
+
+# Answers may arrive as letters or as 0-3 option indexes (the web client sends both)
+ANSWER_LETTERS = 'ABCD'
+
+# Columns a grade is broken down by, and the key each breakdown is reported under
+BREAKDOWN_COLUMNS = (('skill', 'by_skill'), ('domain', 'by_domain'), ('level', 'by_level'))
+
+# Option code for a missing or unrecognized answer; never counts as correct
+NO_ANSWER = 255
+
+# Answer key entry for a question whose correct_option is blank or invalid; no
+# answer code (0-3 or NO_ANSWER) ever equals it, so nothing matches it
+NO_KEY = 254
+
+
+def answer_code(answer):
+    """Map 'b', 'B' or 1 to the option index 1; anything else to NO_ANSWER"""
+    if isinstance(answer, int) and not isinstance(answer, bool):
+        return answer if 0 <= answer < len(ANSWER_LETTERS) else NO_ANSWER
+    answer = str(answer or '').strip().upper()
+    if len(answer) == 1 and answer in ANSWER_LETTERS:
+        return ANSWER_LETTERS.index(answer)
+    return NO_ANSWER
+
+
+def answer_key(bank):
+    """Return the bank's correct options as one option code per row.
+
+    Built from the correct_option codes and vocabulary in a single pass the first
+    time a bank is graded, then kept on the bank (a reload builds a new bank, so
+    it can never go stale).
+    """
+    key = getattr(bank, 'answer_codes', None)
+    if key is None:
+        codes = bank.codes.get('correct_option')
+        if codes is None:
+            key = bytes([NO_KEY]) * len(bank)
+        else:
+            letters = bytes(
+                NO_KEY if code == NO_ANSWER else code
+                for code in map(answer_code, bank.vocabularies['correct_option'])
+            )
+            key = bytes(letters[code] for code in codes)
+        bank.answer_codes = key
+    return key
+
+
+@timed('grade_positions')
+def grade_positions(bank, positions, answers, total_questions=None):
+    """Grade answers to the questions at the given bank row positions.
+
+    positions and answers are parallel sequences; a position of None is a
+    question that isn't in the bank and counts as wrong. Unanswered questions
+    (total_questions beyond len(answers)) also count as wrong. Returns the
+    overall score plus per-skill, per-domain and per-level breakdowns.
+    """
+    key = answer_key(bank)
+    chosen = bytes(answer_code(answer) for answer in answers)
+    # One comparison per answer against the precomputed key, as a byte vector
+    is_correct = bytes(
+        position is not None and code != NO_ANSWER and key[position] == code
+        for position, code in zip(positions, chosen)
+    )
+    correct_answers = sum(is_correct)
+    total_questions = len(answers) if total_questions is None else int(total_questions)
+    accuracy = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+
+    # Format: {'by_skill': {skill: {'correct': 3, 'total': 4, 'accuracy': 75.0}}, ...}
+    breakdowns = {}
+    for column, name in BREAKDOWN_COLUMNS:
+        codes = bank.codes.get(column)
+        if codes is None:
+            continue
+        vocabulary = bank.vocabularies[column]
+        totals = [0] * len(vocabulary)
+        correct = [0] * len(vocabulary)
+        for position, hit in zip(positions, is_correct):
+            if position is not None:
+                code = codes[position]
+                totals[code] += 1
+                correct[code] += hit
+        breakdowns[name] = {
+            vocabulary[code]: {
+                'correct': correct[code],
+                'total': totals[code],
+                'accuracy': correct[code] / totals[code] * 100
+            }
+            for code in range(len(vocabulary)) if totals[code]
+        }
+
+    return {
+        'score': correct_answers,
+        'correct_answers': correct_answers,
+        'total_questions': total_questions,
+        'answered': sum(code != NO_ANSWER for code in chosen),
+        'accuracy': accuracy,
+        'is_correct': [bool(hit) for hit in is_correct],
+        **breakdowns
+    }
+
+
+def grade_answers(bank, answers, total_questions=None, positions_by_id=None):
+    """Grade [{'question_id': ..., 'chosen_option': ...}] answers against a bank"""
+    positions = []
+    chosen = []
+    for answer in answers:
+        question_id = int(answer['question_id'])
+        if positions_by_id is not None:
+            positions.append(positions_by_id.get(question_id))
+        else:
+            positions.append(bank.position_of(question_id))
+        chosen.append(answer.get('chosen_option'))
+    return grade_positions(bank, positions, chosen, total_questions)
+
+
+@timed('grade_sessions')
+def grade_sessions(bank, sessions):
+    """Grade many sessions' answers in one call (e.g. a whole class at the end of an exam).
+
+    sessions is [{'session_id': ..., 'answers': [...], 'total_questions': N}].
+    Each distinct question ID is looked up in the bank once for the whole batch.
+    """
+    question_ids = {int(answer['question_id']) for session in sessions for answer in session.get('answers') or ()}
+    positions_by_id = {question_id: bank.position_of(question_id) for question_id in question_ids}
+
+    results = []
+    for session in sessions:
+        result = grade_answers(bank, session.get('answers') or [], session.get('total_questions'), positions_by_id)
+        result['session_id'] = session.get('session_id')
+        results.append(result)
+    return results
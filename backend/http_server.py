@@ -0,0 +1,188 @@
+import json
+import sys
+
+# Largest request body accepted (bytes)
+MAX_BODY_SIZE = 1024 * 1024
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 75
+
+STATUS_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    """Raised by route handlers to answer with an error status and a JSON message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Response:
+    """A handler result: a status plus either a complete body or an async iterator of chunks"""
+
+    def __init__(self, body=b'', status=200, content_type='application/json', stream=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.stream = stream
+
+
+def json_response(data, status=200):
+    return Response(json.dumps(data), status=status)
+
+
+def error_response(status, message):
+    return json_response({'error': message}, status=status)
+
+
+async def _read_request(reader):
+    """Parse one HTTP/1.1 request; returns None when the client closed the connection"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, 'Malformed request line')
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise HTTPError(400, 'Invalid Content-Length')
+    if length < 0:
+        raise HTTPError(400, 'Invalid Content-Length')
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, 'Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target.split('?', 1)[0], version, headers, body
+
+
+async def _write_response(writer, response, keep_alive):
+    reason = STATUS_REASONS.get(response.status, 'OK')
+    head = [
+        f"HTTP/1.1 {response.status} {reason}",
+        f"Content-Type: {response.content_type}",
+        "Access-Control-Allow-Origin: *",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if response.stream is None:
+        head.append(f"Content-Length: {len(response.body)}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response.body)
+        await writer.drain()
+        return
+
+    head.append("Transfer-Encoding: chunked")
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+    async for chunk in response.stream:
+        if chunk:
+            writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+class ConnectionTracker:
+    """Counts requests in flight and remembers idle keep-alive connections.
+
+    Server.wait_closed() doesn't wait for open connections on every Python
+    version, so graceful shutdown uses drain() instead: idle connections are
+    closed, requests being handled (including streamed responses) finish, and
+    their connections close once the response is written.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.closing = False
+        # Writers of connections waiting for their next request
+        self.idle = set()
+
+    async def drain(self, timeout):
+        """Stop keep-alive and wait up to timeout seconds for in-flight requests; False on timeout"""
+        import asyncio
+        self.closing = True
+        for writer in list(self.idle):
+            writer.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.active:
+            if asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+
+def make_connection_handler(handle_request, connections=None):
+    """Wrap an `async handle_request(method, path, body) -> Response` as a stream handler"""
+
+    import asyncio
+    connections = connections or ConnectionTracker()
+
+    async def handle_connection(reader, writer):
+        try:
+            while not connections.closing:
+                connections.idle.add(writer)
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except HTTPError as e:
+                    await _write_response(writer, error_response(e.status, e.message), keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                finally:
+                    connections.idle.discard(writer)
+                if request is None:
+                    break
+
+                connections.active += 1
+                try:
+                    method, path, version, headers, body = request
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+                    try:
+                        response = await handle_request(method, path, body)
+                    except HTTPError as e:
+                        response = error_response(e.status, e.message)
+                    except Exception as e:
+                        print(f"Unhandled error for {method} {path}: {e}", file=sys.stderr)
+                        response = error_response(500, str(e))
+
+                    # A stopping server tells the client not to reuse the connection
+                    keep_alive = keep_alive and not connections.closing
+                    await _write_response(writer, response, keep_alive)
+                finally:
+                    connections.active -= 1
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle_connection
+
+
+async def start_http_server(handle_request, host='127.0.0.1', port=8000, sock=None, connections=None):
+    """Start serving handle_request on host:port (or an already bound socket)"""
+    import asyncio
+    handler = make_connection_handler(handle_request, connections)
+    if sock is not None:
+        return await asyncio.start_server(handler, sock=sock)
+    return await asyncio.start_server(handler, host, port, reuse_address=True)
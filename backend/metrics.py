@@ -0,0 +1,187 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Histogram bucket upper bounds in seconds: 50us doubling up to ~52s
+BUCKET_BOUNDS = tuple(0.00005 * 2 ** i for i in range(21))
+
+# Quantiles reported in stats and in the Prometheus dump
+REPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count, sum and error count.
+
+    Recording is a bisect over BUCKET_BOUNDS and a few integer updates, so it is
+    cheap enough for every call on the hot path; quantiles are estimated from the
+    buckets when they are read.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        index = bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            if error:
+                self.errors += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile in seconds by interpolating inside its bucket"""
+        with self._lock:
+            buckets = list(self.buckets)
+            count = self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index else 0.0
+                # The overflow bucket has no upper bound; report its lower edge
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKET_BOUNDS[-1]
+
+    def snapshot(self):
+        """Return count, errors, mean and p50/p95/p99 in milliseconds"""
+        result = {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+        }
+        for q in REPORTED_QUANTILES:
+            result[f'p{int(q * 100)}_ms'] = round(self.quantile(q) * 1000, 3)
+        return result
+
+
+class MetricsRegistry:
+    """Per-process latency histograms keyed by stage name.
+
+    When disabled (the default; set QUIZ_METRICS=1 to enable) the timed decorator
+    hands back the undecorated function and stage_timer returns a shared no-op
+    context, so instrumented code runs exactly as it would without metrics.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # Format: {stage: LatencyHistogram}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage, seconds, error=False):
+        if self.enabled:
+            self.histogram(stage).observe(seconds, error)
+
+    def record_error(self, stage):
+        """Count a failure that the instrumented code handled itself (e.g. a logged DB error)"""
+        if self.enabled:
+            histogram = self.histogram(stage)
+            with histogram._lock:
+                histogram.errors += 1
+
+    def snapshot(self):
+        """Return {stage: {'count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}}"""
+        return {stage: histogram.snapshot() for stage, histogram in sorted(self._histograms.items())}
+
+    def prometheus_text(self):
+        """Render every histogram in the Prometheus text exposition format"""
+        if not self.enabled:
+            return "# Quiz metrics are disabled; set QUIZ_METRICS=1 to enable them\n"
+        pid = os.getpid()
+        lines = [
+            "# HELP quiz_stage_duration_seconds Latency of quiz pipeline stages and database calls",
+            "# TYPE quiz_stage_duration_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP quiz_stage_duration_quantile_seconds Estimated latency quantiles per stage",
+            "# TYPE quiz_stage_duration_quantile_seconds gauge",
+        ]
+        error_lines = [
+            "# HELP quiz_stage_errors_total Failed calls per stage",
+            "# TYPE quiz_stage_errors_total counter",
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            # Pre-forked workers each keep their own histograms, so label them by process
+            labels = f'stage="{stage}",pid="{pid}"'
+            with histogram._lock:
+                buckets = list(histogram.buckets)
+                count, total, errors = histogram.count, histogram.total, histogram.errors
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKET_BOUNDS, buckets):
+                cumulative += bucket_count
+                lines.append(f'quiz_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'quiz_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'quiz_stage_duration_seconds_sum{{{labels}}} {total:.9f}')
+            lines.append(f'quiz_stage_duration_seconds_count{{{labels}}} {count}')
+            for q in REPORTED_QUANTILES:
+                quantile_lines.append(
+                    f'quiz_stage_duration_quantile_seconds{{{labels},quantile="{q:g}"}} {histogram.quantile(q):.9f}'
+                )
+            error_lines.append(f'quiz_stage_errors_total{{{labels}}} {errors}')
+        return '\n'.join(lines + quantile_lines + error_lines) + '\n'
+
+
+# Shared by everything in this process
+metrics = MetricsRegistry(enabled=os.environ.get('QUIZ_METRICS', '0').lower() in ('1', 'true', 'yes'))
+
+
+def timed(stage):
+    """Decorator recording a function's latency (and raised exceptions) under stage"""
+    def decorate(function):
+        if not metrics.enabled:
+            return function
+        histogram = metrics.histogram(stage)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                histogram.observe(time.perf_counter() - started, error=True)
+                raise
+            histogram.observe(time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorate
+
+
+_disabled_timer = nullcontext()
+
+
+def stage_timer(stage):
+    """Context manager recording the latency of a block under stage"""
+    if not metrics.enabled:
+        return _disabled_timer
+    return _stage_timer(stage)
+
+
+@contextmanager
+def _stage_timer(stage):
+    histogram = metrics.histogram(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        histogram.observe(time.perf_counter() - started, error=True)
+        raise
+    histogram.observe(time.perf_counter() - started)
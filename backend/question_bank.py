@@ -0,0 +1,787 @@
+import csv
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from json.encoder import encode_basestring_ascii
+
+# Skill strings are split into lowercase tokens for the domain index
+SKILL_TOKEN_PATTERN = re.compile(r'[a-z0-9_+#]+')
+
+# Question IDs are kept within 53 bits so JavaScript clients can hold them as Numbers
+QUESTION_ID_BITS = 53
+
+# An explicit CSV id: digits, optionally with a zero fraction ('12.0' from a spreadsheet export)
+EXPLICIT_ID_PATTERN = re.compile(r'\s*(\d+)(?:\.0*)?\s*')
+
+# Compiled bank file layout: magic, format version, header length, JSON header,
+# then 8-byte aligned array sections described by the header
+COMPILED_BANK_MAGIC = b'QBNK'
+COMPILED_BANK_VERSION = 5
+COMPILED_BANK_PREAMBLE = struct.Struct('<4sHHI')
+
+# Upper bound on memoized (level, domain) candidate lists per bank
+MAX_CACHED_FILTERS = 1024
+
+
+def read_question_csv(path):
+    """Parse a question bank CSV into a list of question dicts"""
+    # Plain csv module: pandas alone costs more to import than a whole quiz request
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return [
+            {name.strip(): value for name, value in row.items() if name is not None}
+            for row in csv.DictReader(f)
+        ]
+
+
+def _text_value(value):
+    # Empty cells are '' from the CSV reader (older banks may still carry NaN)
+    if value is None or value != value:
+        return ''
+    return str(value)
+
+
+def compute_question_id(question):
+    """Return a stable integer ID for a question row.
+
+    An explicit CSV id column wins; otherwise the ID is a digest of the question
+    text and its options, so it is the same in every process and on every node
+    (unlike hash(), which is randomized per interpreter). Raises ValueError for an
+    explicit id that isn't a whole number below 2**QUESTION_ID_BITS.
+    """
+    explicit_id = question.get('id')
+    if explicit_id is not None and explicit_id == explicit_id and explicit_id != '':
+        return _explicit_question_id(explicit_id)
+
+    parts = [_text_value(question.get('question'))]
+    for letter in 'abcd':
+        parts.append(_text_value(question.get(f'option_{letter}', question.get(f'option_{letter.upper()}'))))
+    digest = hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> (64 - QUESTION_ID_BITS)
+
+
+def _explicit_question_id(value):
+    # Parsed without float() so large IDs keep every digit and '12.5' isn't cut to 12
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        question_id = value
+    else:
+        match = EXPLICIT_ID_PATTERN.fullmatch(str(value))
+        if match is None:
+            raise ValueError(f"question id {value!r} is not a whole number")
+        question_id = int(match.group(1))
+    if not 0 <= question_id < 1 << QUESTION_ID_BITS:
+        raise ValueError(f"question id {value!r} is outside 0..2**{QUESTION_ID_BITS}-1")
+    return question_id
+
+
+def load_question_bank_file(path, previous=None):
+    """Load a question bank, from its compiled .qbank file when that is up to date.
+
+    Falls back to parsing the CSV when there is no compiled file or it is stale;
+    previous (the bank being reloaded) lets unchanged rows skip re-encoding.
+    """
+    compiled = open_compiled_bank(compiled_bank_path(path), path)
+    if compiled is not None:
+        return compiled
+    return QuestionBank(read_question_csv(path), previous)
+
+
+def encode_questions(questions, include_answers=True):
+    """Encode questions as a JSON array (bytes) by joining their pre-encoded fragments.
+
+    The output is byte-for-byte what json.dumps([q.to_dict() for q in questions])
+    produces; include_answers=False leaves out each question's correct_option.
+    """
+    parts = []
+    for question in questions:
+        if isinstance(question, QuestionView):
+            parts.append(question.bank.fragment(question.position, include_answers))
+        else:
+            row = dict(question)
+            if not include_answers:
+                row.pop('correct_option', None)
+            parts.append(json.dumps(row).encode('ascii'))
+    return b'[' + b', '.join(parts) + b']'
+
+
+def sample_positions(population_size, rng):
+    """Yield distinct positions in range(population_size) in random order.
+
+    A lazy Fisher-Yates shuffle that only remembers swapped slots, so drawing k
+    positions costs O(k) time and memory however large the population is.
+    """
+    swapped = {}
+    for i in range(population_size):
+        j = rng.randrange(i, population_size)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
+
+class QuestionView:
+    """Dict-like, read-only view of one bank row; values are decoded on access"""
+
+    __slots__ = ('bank', 'position')
+
+    def __init__(self, bank, position):
+        self.bank = bank
+        self.position = position
+
+    def __getitem__(self, column):
+        return self.bank.value(self.position, column)
+
+    def get(self, column, default=None):
+        try:
+            return self.bank.value(self.position, column)
+        except KeyError:
+            return default
+
+    def __contains__(self, column):
+        return column == 'id' or column in self.bank.column_slots
+
+    def keys(self):
+        return list(self.bank.columns) + ['id']
+
+    def to_dict(self):
+        """Materialize the row as a plain dict (column order of the CSV, then 'id')"""
+        return {column: self.bank.value(self.position, column) for column in self.keys()}
+
+    def __repr__(self):
+        return f"QuestionView({self.to_dict()!r})"
+
+
+class QuestionSelection(Sequence):
+    """Read-only list of questions backed by a bank and an array of row positions"""
+
+    def __init__(self, bank, ids):
+        self.bank = bank
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.bank.question(i) for i in self.ids[index]]
+        return self.bank.question(self.ids[index])
+
+
+class QuestionBank:
+    """Compact columnar question bank with prebuilt level and skill-token indexes.
+
+    Low-cardinality columns (level, domain, skill, correct_option) are stored as
+    interned integer codes in arrays, and every other column's text is kept only
+    once, as the escaped JSON string inside the row's pre-encoded fragment, located
+    by text_spans; so a row costs a few array slots instead of a dict.
+    QuestionView objects are created only for the questions a request actually
+    touches.
+
+    Filtering is a set intersection over the indexes instead of a scan over every
+    row, and the result for each (level, domain) pair is memoized. Every question
+    gets its stable 'id' here, once per load, together with its JSON encoding
+    (see fragment()).
+    """
+
+    # Columns stored as integer codes into a per-column vocabulary
+    CODED_COLUMNS = ('level', 'domain', 'skill', 'correct_option')
+
+    def __init__(self, rows, previous=None):
+        """Build a bank from question dicts.
+
+        previous is the bank version this one replaces (for a reload). Rows whose
+        stable ID and content are unchanged since previous reuse its encoded JSON
+        fragment instead of being encoded again, and reload_stats records how many
+        rows were added, removed, changed and unchanged.
+        """
+        self.columns = []
+        self.ids = array('q')
+        # Format: {column: array of codes}, {column: [value, ...]}
+        self.codes = {}
+        self.vocabularies = {}
+        self.text_columns = []
+        # Escaped JSON literal of every text cell, row by row, until the fragments are built
+        text_literals = []
+        code_lookup = {}
+        # Format: {position: position of the identical row in previous}
+        unchanged = {}
+        seen_ids = set()
+        duplicates = 0
+        invalid_ids = 0
+
+        for row in rows:
+            if not self.columns:
+                self.columns = [column for column in row if column != 'id']
+                self.text_columns = [column for column in self.columns if column not in self.CODED_COLUMNS]
+                for column in self.columns:
+                    if column in self.CODED_COLUMNS:
+                        self.codes[column] = array('I')
+                        self.vocabularies[column] = []
+                        code_lookup[column] = {}
+                # Rows can only be compared against a bank with the same layout
+                if previous is not None and list(previous.columns) != self.columns:
+                    previous = None
+
+            try:
+                question_id = compute_question_id(row)
+            except ValueError:
+                invalid_ids += 1
+                continue
+            # The same question text and options (e.g. listed under two levels) get
+            # the same ID; keep the first so IDs stay unique for lookups and storage
+            if question_id in seen_ids:
+                duplicates += 1
+                continue
+            seen_ids.add(question_id)
+            previous_position = previous.position_of(question_id) if previous is not None else None
+            self.ids.append(question_id)
+            for column, codes in self.codes.items():
+                value = sys.intern(_text_value(row.get(column)))
+                code = code_lookup[column].get(value)
+                if code is None:
+                    code = code_lookup[column][value] = len(self.vocabularies[column])
+                    self.vocabularies[column].append(value)
+                codes.append(code)
+                if previous_position is not None and previous.value(previous_position, column) != value:
+                    previous_position = None
+            for number, column in enumerate(self.text_columns):
+                literal = encode_basestring_ascii(_text_value(row.get(column))).encode('ascii')
+                text_literals.append(literal)
+                if previous_position is not None and previous._text_literal(previous_position, number) != literal:
+                    previous_position = None
+            if previous_position is not None:
+                unchanged[len(self.ids) - 1] = previous_position
+
+        if invalid_ids:
+            print(f"Warning: skipped {invalid_ids} questions with an invalid id "
+                  f"(not a whole number below 2**{QUESTION_ID_BITS})", file=sys.stderr)
+        if duplicates:
+            print(f"Warning: skipped {duplicates} duplicate questions (same question ID as an earlier row)",
+                  file=sys.stderr)
+        self._init_lookups()
+        self._build_fragments(text_literals, previous, unchanged)
+        self._build_indexes()
+
+        self.reload_stats = None
+        if previous is not None:
+            new_ids = set(self.ids)
+            previous_ids = set(previous.ids)
+            added = len(new_ids - previous_ids)
+            self.reload_stats = {
+                'added': added,
+                'removed': len(previous_ids - new_ids),
+                'changed': len(self.ids) - added - len(unchanged),
+                'unchanged': len(unchanged)
+            }
+
+    def _init_lookups(self):
+        # Format: {column: ('code', codes, vocabulary) or ('text', column number)}
+        self.column_slots = {}
+        for column, codes in self.codes.items():
+            self.column_slots[column] = ('code', codes, self.vocabularies[column])
+        for number, column in enumerate(self.text_columns):
+            self.column_slots[column] = ('text', number, None)
+        self._text_width = len(self.text_columns)
+        self._domain_ids = {}
+        self._candidates = {}
+
+    def _build_indexes(self):
+        # Sorted IDs with their row positions, searched with bisect
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.sorted_ids = array('q', (self.ids[position] for position in order))
+        self.sorted_positions = array('I', order)
+
+        # Format: {level: array(row positions)}
+        self.level_index = {}
+        level_codes = self.codes.get('level')
+        if level_codes is not None:
+            by_code = {}
+            for position, code in enumerate(level_codes):
+                by_code.setdefault(code, array('I')).append(position)
+            self.level_index = {self.vocabularies['level'][code]: ids for code, ids in by_code.items()}
+
+        # Format: {lowercase skill token: array(row positions)}
+        self.skill_index = {}
+        if 'skills' in self.column_slots:
+            for position in range(len(self.ids)):
+                skills = self.value(position, 'skills').lower()
+                for token in set(SKILL_TOKEN_PATTERN.findall(skills)):
+                    self.skill_index.setdefault(token, array('I')).append(position)
+
+    def _build_fragments(self, text_literals, previous=None, unchanged=None):
+        # Each row's JSON object, exactly as json.dumps(view.to_dict()) writes it,
+        # concatenated into one blob addressed by fragment_offsets. answer_spans
+        # holds, per row, the byte range of the '"correct_option": "X", ' member so
+        # it can be cut out for client-facing payloads, and text_spans the byte
+        # range of each text cell's string literal (quotes included), both relative
+        # to the start of the row's fragment.
+        keys = [encode_basestring_ascii(column).encode('ascii') + b': ' for column in self.columns]
+        id_key = b'"id": '
+        encoded_vocabularies = {
+            column: [encode_basestring_ascii(value).encode('ascii') for value in vocabulary]
+            for column, vocabulary in self.vocabularies.items()
+        }
+        slots = [self.column_slots[column] for column in self.columns]
+        answer_member = self.columns.index('correct_option') if 'correct_option' in self.columns else None
+
+        parts = []
+        self.fragment_offsets = array('Q', [0])
+        self.answer_spans = array('I')
+        self.text_spans = array('I')
+        width = self._text_width
+        size = 0
+        for position in range(len(self.ids)):
+            previous_position = unchanged.get(position) if unchanged else None
+            if previous_position is not None:
+                # Same ID and content as in the bank being replaced; copy its encoding
+                fragment = previous.fragment(previous_position)
+                self.answer_spans.extend(previous.answer_spans[2 * previous_position:2 * previous_position + 2])
+                cells = 2 * width * previous_position
+                self.text_spans.extend(previous.text_spans[cells:cells + 2 * width])
+                parts.append(fragment)
+                size += len(fragment)
+                self.fragment_offsets.append(size)
+                continue
+
+            members = []
+            answer_span = (0, 0)
+            # Byte offset of the current member within the fragment, after '{'
+            offset = 1
+            for number, (column, key, (kind, slot, _)) in enumerate(zip(self.columns, keys, slots)):
+                if kind == 'code':
+                    member = key + encoded_vocabularies[column][slot[position]]
+                else:
+                    member = key + text_literals[position * width + slot]
+                    self.text_spans.extend((offset + len(key), offset + len(member)))
+                if number == answer_member:
+                    # 'id' is always the last member, so correct_option is followed by ', '
+                    answer_span = (offset, offset + len(member) + 2)
+                members.append(member)
+                offset += len(member) + 2
+            members.append(id_key + b'%d' % self.ids[position])
+            fragment = b'{' + b', '.join(members) + b'}'
+            self.answer_spans.extend(answer_span)
+
+            parts.append(fragment)
+            size += len(fragment)
+            self.fragment_offsets.append(size)
+        self.fragment_blob = b''.join(parts)
+
+    def fragment(self, position, include_answers=True):
+        """Return one question's pre-encoded JSON object as bytes"""
+        fragment = bytes(self.fragment_blob[self.fragment_offsets[position]:self.fragment_offsets[position + 1]])
+        if include_answers:
+            return fragment
+        start, end = self.answer_spans[2 * position], self.answer_spans[2 * position + 1]
+        return fragment[:start] + fragment[end:]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (QuestionView(self, position) for position in range(len(self.ids)))
+
+    def __getitem__(self, position):
+        return self.question(position)
+
+    def question(self, position):
+        if position < 0 or position >= len(self.ids):
+            raise IndexError(position)
+        return QuestionView(self, position)
+
+    def value(self, position, column):
+        """Decode one cell; raises KeyError for unknown columns"""
+        if column == 'id':
+            return self.ids[position]
+        kind, slot, vocabulary = self.column_slots[column]
+        if kind == 'code':
+            return vocabulary[slot[position]]
+        literal = self._text_literal(position, slot)
+        if b'\\' not in literal:
+            # Nothing escaped, so the literal is the ASCII text between its quotes
+            return str(literal[1:-1], 'ascii')
+        return json.loads(literal)
+
+    def _text_literal(self, position, slot):
+        # bytes() so the blob can be bytes or an mmap memoryview
+        cell = 2 * (position * self._text_width + slot)
+        start = self.fragment_offsets[position]
+        return bytes(self.fragment_blob[start + self.text_spans[cell]:start + self.text_spans[cell + 1]])
+
+    def position_of(self, question_id):
+        """Return the row position of a stable question ID, or None if it isn't in this bank"""
+        index = bisect_left(self.sorted_ids, question_id)
+        if index == len(self.sorted_ids) or self.sorted_ids[index] != question_id:
+            return None
+        return self.sorted_positions[index]
+
+    def get_question(self, question_id):
+        """Look up a question by its stable ID, or None if it isn't in this bank"""
+        position = self.position_of(question_id)
+        return None if position is None else QuestionView(self, position)
+
+    def domain_ids(self, domain):
+        """Row positions whose skills mention domain (same match as `domain in skills.lower()`)"""
+        ids = self._domain_ids.get(domain)
+        if ids is not None:
+            return ids
+
+        if SKILL_TOKEN_PATTERN.fullmatch(domain):
+            # Substring match over the distinct tokens, not over every row
+            matched = set()
+            for token, token_ids in self.skill_index.items():
+                if domain in token:
+                    matched.update(token_ids)
+            ids = frozenset(matched)
+        elif 'skills' in self.column_slots:
+            # Domains spanning token separators need the original row scan
+            ids = frozenset(
+                position for position in range(len(self.ids))
+                if domain in self.value(position, 'skills').lower()
+            )
+        else:
+            ids = frozenset()
+
+        if len(self._domain_ids) < MAX_CACHED_FILTERS:
+            self._domain_ids[domain] = ids
+        return ids
+
+    def select(self, level=None, domain=None):
+        """Return the questions matching a level and/or domain as a QuestionSelection"""
+        key = (level, domain)
+        ids = self._candidates.get(key)
+        if ids is None:
+            if level is None and domain is None:
+                ids = range(len(self.ids))
+            elif domain is None:
+                ids = self.level_index.get(level, array('I'))
+            else:
+                matched = self.domain_ids(domain)
+                if level is not None:
+                    matched = matched.intersection(self.level_index.get(level, ()))
+                ids = array('I', sorted(matched))
+            if len(self._candidates) < MAX_CACHED_FILTERS:
+                self._candidates[key] = ids
+        return QuestionSelection(self, ids)
+
+
+def compiled_bank_path(csv_path):
+    """technical_skills.csv -> technical_skills.qbank"""
+    return os.path.splitext(csv_path)[0] + '.qbank'
+
+
+def _postings(index):
+    """Flatten {key: positions} into one array plus {key: [start, count]}"""
+    flat = array('I')
+    spans = {}
+    for key, positions in index.items():
+        spans[key] = [len(flat), len(positions)]
+        flat.extend(positions)
+    return flat, spans
+
+
+def compile_question_bank(csv_path, output_path=None):
+    """Compile a question bank CSV into a versioned binary .qbank file.
+
+    The file holds the bank's arrays (IDs, column codes, sorted ID lookup, index
+    postings, JSON fragment offsets and text spans) as aligned sections plus the
+    JSON fragment blob, so open_compiled_bank can map it without parsing or
+    encoding anything. Returns the bank.
+    """
+    output_path = output_path or compiled_bank_path(csv_path)
+    stat = os.stat(csv_path)
+    bank = QuestionBank(read_question_csv(csv_path))
+
+    level_postings, level_spans = _postings(bank.level_index)
+    skill_postings, skill_spans = _postings(bank.skill_index)
+    sections = [('ids', bank.ids), ('text_spans', bank.text_spans),
+                ('sorted_ids', bank.sorted_ids), ('sorted_positions', bank.sorted_positions),
+                ('level_postings', level_postings), ('skill_postings', skill_postings),
+                ('fragment_offsets', bank.fragment_offsets), ('answer_spans', bank.answer_spans)]
+    sections += [(f'codes:{column}', codes) for column, codes in bank.codes.items()]
+    sections += [('fragment_blob', bank.fragment_blob)]
+
+    # Lay the sections out after the header, each aligned to 8 bytes
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        typecode = data.typecode if isinstance(data, array) else 'B'
+        length = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        layout[name] = [offset, length, typecode]
+        offset += length + (-length % 8)
+
+    header = json.dumps({
+        'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+        'byteorder': sys.byteorder,
+        'rows': len(bank),
+        'columns': bank.columns,
+        'text_columns': bank.text_columns,
+        'vocabularies': bank.vocabularies,
+        'level_index': level_spans,
+        'skill_index': skill_spans,
+        'sections': layout,
+    }).encode('utf-8')
+    data_start = COMPILED_BANK_PREAMBLE.size + len(header)
+    data_start += -data_start % 8
+
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(COMPILED_BANK_PREAMBLE.pack(COMPILED_BANK_MAGIC, COMPILED_BANK_VERSION, 0, len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.seek(data_start + layout[name][0])
+            f.write(data.tobytes() if isinstance(data, array) else data)
+        f.truncate(data_start + offset)
+    os.replace(temp_path, output_path)
+    return bank
+
+
+def open_compiled_bank(path, csv_path=None):
+    """Memory-map a compiled .qbank file as a QuestionBank without copying its arrays.
+
+    Returns None if the file is missing, from another format version or byte
+    order, or stale relative to csv_path (size or mtime changed).
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    # A truncated or corrupt file is treated like a missing one, so the CSV is used
+    try:
+        return _map_compiled_bank(mapped, csv_path)
+    except (struct.error, ValueError, KeyError, TypeError, IndexError) as e:
+        print(f"Warning: Ignoring unreadable compiled bank '{path}': {e}", file=sys.stderr)
+        return None
+
+
+def _map_compiled_bank(mapped, csv_path):
+    magic, version, _, header_length = COMPILED_BANK_PREAMBLE.unpack_from(mapped, 0)
+    if magic != COMPILED_BANK_MAGIC or version != COMPILED_BANK_VERSION:
+        return None
+    header = json.loads(mapped[COMPILED_BANK_PREAMBLE.size:COMPILED_BANK_PREAMBLE.size + header_length])
+    if header['byteorder'] != sys.byteorder:
+        return None
+    if csv_path is not None:
+        try:
+            stat = os.stat(csv_path)
+        except OSError:
+            return None
+        if header['source'] != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+            return None
+
+    data_start = COMPILED_BANK_PREAMBLE.size + header_length
+    data_start += -data_start % 8
+    view = memoryview(mapped)
+
+    def section(name):
+        offset, length, typecode = header['sections'][name]
+        if data_start + offset + length > len(mapped):
+            raise ValueError(f"section {name} runs past the end of the file")
+        data = view[data_start + offset:data_start + offset + length]
+        return data if typecode == 'B' else data.cast(typecode)
+
+    def unflatten(postings, spans):
+        return {key: postings[start:start + count] for key, (start, count) in spans.items()}
+
+    bank = QuestionBank.__new__(QuestionBank)
+    bank.mapped_file = mapped
+    bank.reload_stats = None
+    bank.columns = header['columns']
+    bank.text_columns = header['text_columns']
+    bank.vocabularies = header['vocabularies']
+    bank.ids = section('ids')
+    bank.codes = {column: section(f'codes:{column}') for column in bank.vocabularies}
+    bank.text_spans = section('text_spans')
+    bank.sorted_ids = section('sorted_ids')
+    bank.sorted_positions = section('sorted_positions')
+    bank.level_index = unflatten(section('level_postings'), header['level_index'])
+    bank.skill_index = unflatten(section('skill_postings'), header['skill_index'])
+    bank.fragment_offsets = section('fragment_offsets')
+    bank.answer_spans = section('answer_spans')
+    bank.fragment_blob = section('fragment_blob')
+    bank._init_lookups()
+    return bank
+
+
+class QuestionBankCache:
+    """Process-wide cache of parsed question banks, keyed by quiz type.
+
+    A bank is re-parsed only when its CSV's mtime or size changes, so a long-lived
+    worker reads each file once no matter how many quizzes it serves. When a CSV
+    changes under a loaded bank, the new version is built in a background thread
+    (reusing the encoding of unchanged rows) while requests keep getting the
+    current version, and the entry is swapped in one assignment when it is ready.
+    """
+
+    def __init__(self, loader=load_question_bank_file, background_reload=True):
+        self.loader = loader
+        # Format: {quiz_type: {'path': ..., 'signature': (mtime_ns, size), 'questions': QuestionBank,
+        #                      'version': int, 'load_seconds': float, 'compiled': bool, 'reload_stats': dict}}
+        self._banks = {}
+        self._lock = threading.Lock()
+        # Quiz types with a background reload in flight
+        self._reloading = set()
+        # Format: {quiz_type: (path, signature)} of a file version that failed to
+        # load; it isn't retried until the file changes again
+        self._failed = {}
+        # Pre-forked workers turn this off and leave reloads to the supervisor
+        self.check_files = True
+        self.background_reload = background_reload
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _file_signature(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, quiz_type, path):
+        """Return the QuestionBank for a quiz type, parsing the CSV only if it changed"""
+        entry = self._banks.get(quiz_type)
+        if not self.check_files and entry and entry['path'] == path:
+            self.hits += 1
+            return entry['questions']
+
+        signature = self._file_signature(path)
+        if entry and entry['path'] == path and entry['signature'] == signature:
+            self.hits += 1
+            return entry['questions']
+
+        if entry and entry['path'] == path and self.background_reload:
+            # Keep serving the current version while the new one is built
+            if self._failed.get(quiz_type) != (path, signature):
+                self._start_reload(quiz_type, path)
+            self.hits += 1
+            return entry['questions']
+
+        with self._lock:
+            # Another thread may have loaded it while we waited for the lock
+            entry = self._banks.get(quiz_type)
+            if entry and entry['path'] == path and entry['signature'] == signature:
+                self.hits += 1
+                return entry['questions']
+            return self._load(quiz_type, path, signature, entry)
+
+    def _load(self, quiz_type, path, signature, entry):
+        previous = entry['questions'] if entry and entry['path'] == path else None
+        started = time.perf_counter()
+        try:
+            questions = self.loader(path, previous)
+        except Exception:
+            self._failed[quiz_type] = (path, signature)
+            raise
+        self._failed.pop(quiz_type, None)
+        load_seconds = time.perf_counter() - started
+        if entry:
+            self.reloads += 1
+        else:
+            self.misses += 1
+        # One dict assignment: readers see either the old entry or the new one
+        self._banks[quiz_type] = {
+            'path': path, 'signature': signature, 'questions': questions,
+            'version': entry['version'] + 1 if entry else 1,
+            'load_seconds': load_seconds, 'compiled': getattr(questions, 'mapped_file', None) is not None,
+            'reload_stats': getattr(questions, 'reload_stats', None)
+        }
+        return questions
+
+    def reload(self, quiz_type, path=None):
+        """Rebuild one bank if its CSV changed and swap the new version in; returns the current bank"""
+        entry = self._banks.get(quiz_type)
+        path = path or entry['path']
+        signature = self._file_signature(path)
+        if entry and entry['path'] == path and entry['signature'] == signature:
+            return entry['questions']
+        return self._load(quiz_type, path, signature, entry)
+
+    def _start_reload(self, quiz_type, path):
+        with self._lock:
+            if quiz_type in self._reloading:
+                return
+            self._reloading.add(quiz_type)
+        threading.Thread(
+            target=self._reload_in_background, args=(quiz_type, path),
+            name=f'bank-reload-{quiz_type}', daemon=True
+        ).start()
+
+    def _reload_in_background(self, quiz_type, path):
+        try:
+            self.reload(quiz_type, path)
+        except Exception as e:
+            print(f"Warning: Could not reload question bank '{path}': {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._reloading.discard(quiz_type)
+
+    def refresh(self):
+        """Reload every stale bank now, in the calling thread; returns the quiz types reloaded"""
+        reloaded = []
+        for quiz_type in self.stale_banks():
+            try:
+                self.reload(quiz_type)
+                reloaded.append(quiz_type)
+            except Exception as e:
+                print(f"Warning: Could not reload question bank for quiz type {quiz_type}: {e}", file=sys.stderr)
+        return reloaded
+
+    def warm_up(self, banks):
+        """Load every bank up front. banks is {quiz_type: csv_path}"""
+        for quiz_type, path in banks.items():
+            try:
+                self.get(quiz_type, path)
+            except Exception as e:
+                print(f"Warning: Could not preload question bank '{path}': {e}")
+
+    def stale_banks(self):
+        """Return the quiz types whose CSV changed (or vanished) since it was loaded.
+
+        A changed file that already failed to load isn't stale again until it changes.
+        """
+        stale = []
+        for quiz_type, entry in list(self._banks.items()):
+            try:
+                signature = self._file_signature(entry['path'])
+                if signature != entry['signature'] and self._failed.get(quiz_type) != (entry['path'], signature):
+                    stale.append(quiz_type)
+            except OSError:
+                stale.append(quiz_type)
+        return stale
+
+    def banks(self):
+        """Return {quiz_type: QuestionBank} for every bank currently loaded"""
+        return {quiz_type: entry['questions'] for quiz_type, entry in list(self._banks.items())}
+
+    def clear(self):
+        with self._lock:
+            self._banks.clear()
+
+    def stats(self):
+        """Return hit/miss/reload counters and the banks currently held"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'reloading': sorted(self._reloading),
+            'banks': {
+                quiz_type: {
+                    'path': entry['path'], 'questions': len(entry['questions']), 'version': entry['version'],
+                    'load_ms': round(entry['load_seconds'] * 1000, 3), 'compiled': entry['compiled'],
+                    'last_reload': entry['reload_stats']
+                }
+                for quiz_type, entry in self._banks.items()
+            }
+        }
+
+
+# Shared by every QuizSystem instance in this process
+question_bank_cache = QuestionBankCache()
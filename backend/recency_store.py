@@ -0,0 +1,206 @@
+import heapq
+import os
+import sys
+import threading
+import time
+
+from db_schema import ensure_schema
+
+# Shared backends delete expired rows at most this often (in seconds)
+EXPIRE_INTERVAL = 60
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+SQLITE_BATCH_SIZE = 500
+
+
+class RecencyStore:
+    """Tracks when each question was last served, per quiz type, for the cooldown.
+
+    last_used() only ever looks at the IDs it is given, so callers never pull the
+    whole table, and expiry works off a time-ordered structure instead of a walk
+    over every entry.
+    """
+
+    def __init__(self, cooldown):
+        self.cooldown = cooldown
+
+    def last_used(self, quiz_type, question_ids, now=None):
+        """Return {question_id: timestamp} for the given IDs still inside the cooldown"""
+        raise NotImplementedError
+
+    def mark_used(self, quiz_type, question_ids, timestamp=None):
+        """Record that the given questions were just served"""
+        raise NotImplementedError
+
+    def expire(self, now=None):
+        """Drop entries older than the cooldown"""
+        raise NotImplementedError
+
+
+class InMemoryRecencyStore(RecencyStore):
+    """Per-process store: a dict for lookups plus a min-heap of timestamps for expiry"""
+
+    def __init__(self, cooldown):
+        super().__init__(cooldown)
+        # Format: {quiz_type: {question_id: timestamp}}
+        self._last_used = {}
+        # Format: [(timestamp, quiz_type, question_id)], oldest first
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def last_used(self, quiz_type, question_ids, now=None):
+        cutoff = (now or time.time()) - self.cooldown
+        used = self._last_used.get(quiz_type)
+        if not used:
+            return {}
+        result = {}
+        for question_id in question_ids:
+            timestamp = used.get(question_id)
+            if timestamp is not None and timestamp > cutoff:
+                result[question_id] = timestamp
+        return result
+
+    def mark_used(self, quiz_type, question_ids, timestamp=None):
+        timestamp = timestamp or time.time()
+        with self._lock:
+            used = self._last_used.setdefault(quiz_type, {})
+            for question_id in question_ids:
+                used[question_id] = timestamp
+                heapq.heappush(self._heap, (timestamp, quiz_type, question_id))
+
+    def expire(self, now=None):
+        cutoff = (now or time.time()) - self.cooldown
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff:
+                timestamp, quiz_type, question_id = heapq.heappop(self._heap)
+                used = self._last_used.get(quiz_type)
+                # Skip heap entries superseded by a later mark_used
+                if used is not None and used.get(question_id) == timestamp:
+                    del used[question_id]
+
+
+class SQLiteRecencyStore(RecencyStore):
+    """Store shared by every worker process on a node through one SQLite file"""
+
+    def __init__(self, cooldown, path):
+        super().__init__(cooldown)
+        self.path = path
+        self._last_expire = 0
+        self._lock = threading.Lock()
+        import sqlite3
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recently_used_questions (
+                quiz_type TEXT NOT NULL,
+                question_id INTEGER NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (quiz_type, question_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_recently_used_questions_used_at ON recently_used_questions(used_at)")
+
+    def last_used(self, quiz_type, question_ids, now=None):
+        cutoff = (now or time.time()) - self.cooldown
+        question_ids = list(question_ids)
+        result = {}
+        with self._lock:
+            for start in range(0, len(question_ids), SQLITE_BATCH_SIZE):
+                batch = question_ids[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT question_id, used_at FROM recently_used_questions "
+                    f"WHERE quiz_type = ? AND used_at > ? AND question_id IN ({placeholders})",
+                    [quiz_type, cutoff] + batch
+                )
+                result.update(rows)
+        return result
+
+    def mark_used(self, quiz_type, question_ids, timestamp=None):
+        timestamp = timestamp or time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("""
+                    INSERT INTO recently_used_questions (quiz_type, question_id, used_at) VALUES (?, ?, ?)
+                    ON CONFLICT (quiz_type, question_id) DO UPDATE SET used_at = excluded.used_at
+                """, [(quiz_type, question_id, timestamp) for question_id in question_ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def expire(self, now=None):
+        now = now or time.time()
+        if now - self._last_expire < EXPIRE_INTERVAL:
+            return
+        self._last_expire = now
+        # Range delete on the used_at index; only touches expired rows
+        with self._lock:
+            self._conn.execute("DELETE FROM recently_used_questions WHERE used_at <= ?", (now - self.cooldown,))
+
+
+class PostgresRecencyStore(RecencyStore):
+    """Store shared by every worker on every node through the quiz database.
+
+    Connections come from the shared DBConnectionPool. If the database is
+    unreachable the store behaves as if nothing was used recently rather than
+    failing question selection.
+    """
+
+    def __init__(self, cooldown, pool):
+        super().__init__(cooldown)
+        self.pool = pool
+        self._last_expire = 0
+
+    def _run(self, statement, params, fetch=False, many=False):
+        try:
+            # The table comes from schema migration 4; after the first call this is a flag check
+            ensure_schema(self.pool)
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                if many:
+                    cursor.executemany(statement, params)
+                else:
+                    cursor.execute(statement, params)
+                rows = cursor.fetchall() if fetch else None
+                conn.commit()
+                cursor.close()
+                return rows
+        except Exception as e:
+            # stdout carries api_mode's JSON
+            print(f"Recency store error: {e}", file=sys.stderr)
+            return [] if fetch else None
+
+    def last_used(self, quiz_type, question_ids, now=None):
+        cutoff = (now or time.time()) - self.cooldown
+        rows = self._run("""
+            SELECT question_id, used_at FROM recently_used_questions
+            WHERE quiz_type = %s AND used_at > %s AND question_id = ANY(%s)
+        """, (quiz_type, cutoff, list(question_ids)), fetch=True)
+        return dict(rows)
+
+    def mark_used(self, quiz_type, question_ids, timestamp=None):
+        timestamp = timestamp or time.time()
+        self._run("""
+            INSERT INTO recently_used_questions (quiz_type, question_id, used_at) VALUES (%s, %s, %s)
+            ON CONFLICT (quiz_type, question_id) DO UPDATE SET used_at = EXCLUDED.used_at
+        """, [(quiz_type, question_id, timestamp) for question_id in question_ids], many=True)
+
+    def expire(self, now=None):
+        now = now or time.time()
+        if now - self._last_expire < EXPIRE_INTERVAL:
+            return
+        self._last_expire = now
+        self._run("DELETE FROM recently_used_questions WHERE used_at <= %s", (now - self.cooldown,))
+
+
+def create_recency_store(cooldown, pool=None):
+    """Build the recency store selected by QUIZ_RECENCY_BACKEND (memory, sqlite or postgres)"""
+    backend = os.environ.get('QUIZ_RECENCY_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recently_used_questions.sqlite3')
+        return SQLiteRecencyStore(cooldown, os.environ.get('QUIZ_RECENCY_SQLITE_PATH', default_path))
+    if backend == 'postgres':
+        return PostgresRecencyStore(cooldown, pool)
+    return InMemoryRecencyStore(cooldown)
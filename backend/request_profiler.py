@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Functions whose time is reported as the stage timings of a profiled request
+STAGE_FUNCTIONS = (
+    'load_question_bank', 'filter_questions', 'select_random_questions', 'select_questions',
+    'encode_questions', 'calculate_results', 'grade_sessions', 'generate_cohort',
+)
+
+# How often the collapsed-stack sampler looks at the request thread (seconds)
+SAMPLE_INTERVAL = 0.001
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        # Format: {'outer (file.py:10);inner (file.py:42)': samples}
+        self.stacks = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+class RequestProfiler:
+    """Profiles individual requests on demand and writes one profile per request.
+
+    A request is profiled when it is picked by sample_rate, or when it asks to be
+    (a "profile": true flag) and allow_requested is on. Each profile is written to directory as pstats
+    (.prof, from cProfile) or collapsed stacks (.folded, from a stack sampler,
+    ready for flamegraph tools), next to a .json file with the session ID, the
+    total time and the time spent in each STAGE_FUNCTIONS stage. Requests that
+    aren't profiled pay for one comparison; cProfile and pstats are only
+    imported once a request is profiled.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, output_format='pstats', allow_requested=False):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.output_format = output_format
+        # Any client can send "profile": true, so the flag is ignored unless this is on
+        self.allow_requested = allow_requested
+        # Only one request is profiled at a time; others run unprofiled meanwhile
+        self._lock = threading.Lock()
+        self.profiled = 0
+        self.skipped = 0
+
+    def should_profile(self, requested=False):
+        """Return True if this request was sampled, or flagged for profiling and flags are allowed"""
+        if requested and self.allow_requested:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile_call(self, function, *args, session_id=None, label='request'):
+        """Run function(*args), profiling it if no other profile is in progress"""
+        if not self._lock.acquire(blocking=False):
+            self.skipped += 1
+            return function(*args)
+        try:
+            started_at = datetime.now()
+            started = time.perf_counter()
+            if self.output_format == 'collapsed':
+                sampler = StackSampler(threading.get_ident())
+                sampler.start()
+                try:
+                    result = function(*args)
+                finally:
+                    sampler.stop()
+                    total = time.perf_counter() - started
+                    self._write_collapsed(sampler, session_id, label, started_at, total)
+            else:
+                import cProfile
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    result = function(*args)
+                finally:
+                    profile.disable()
+                    total = time.perf_counter() - started
+                    self._write_pstats(profile, session_id, label, started_at, total)
+            self.profiled += 1
+            return result
+        finally:
+            self._lock.release()
+
+    def _base_path(self, session_id, label, started_at):
+        os.makedirs(self.directory, exist_ok=True)
+        tag = re.sub(r'[^A-Za-z0-9_.-]', '_', str(session_id or 'no-session'))[:80]
+        return os.path.join(self.directory, f"{started_at:%Y%m%d-%H%M%S-%f}_{label}_{tag}_{os.getpid()}")
+
+    def _write_pstats(self, profile, session_id, label, started_at, total):
+        import pstats
+        base_path = self._base_path(session_id, label, started_at)
+        profile.dump_stats(base_path + '.prof')
+        # pstats keys are (file, line, function); cumulative time includes callees
+        stages = {}
+        for (_, _, name), (_, _, _, cumulative, _) in pstats.Stats(profile).stats.items():
+            if name in STAGE_FUNCTIONS:
+                stages[name] = stages.get(name, 0.0) + cumulative
+        self._write_summary(base_path, base_path + '.prof', session_id, label, started_at, total, stages)
+
+    def _write_collapsed(self, sampler, session_id, label, started_at, total):
+        base_path = self._base_path(session_id, label, started_at)
+        with open(base_path + '.folded', 'w') as f:
+            for stack, samples in sorted(sampler.stacks.items()):
+                f.write(f"{stack} {samples}\n")
+        # A stage's time is the samples whose stack passes through it
+        stages = {}
+        for stack, samples in sampler.stacks.items():
+            names = {frame.split(' ', 1)[0] for frame in stack.split(';')}
+            for name in names.intersection(STAGE_FUNCTIONS):
+                stages[name] = stages.get(name, 0.0) + samples * sampler.interval
+        self._write_summary(base_path, base_path + '.folded', session_id, label, started_at, total, stages)
+
+    def _write_summary(self, base_path, profile_path, session_id, label, started_at, total, stages):
+        summary = {
+            'session_id': session_id,
+            'label': label,
+            'pid': os.getpid(),
+            'started_at': started_at.isoformat(),
+            'total_ms': round(total * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+            'format': self.output_format,
+            'profile': os.path.basename(profile_path)
+        }
+        with open(base_path + '.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Request profile written to {profile_path}", file=sys.stderr)
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'sample_rate': self.sample_rate,
+            'format': self.output_format,
+            'allow_requested': self.allow_requested,
+            'profiled': self.profiled,
+            'skipped': self.skipped
+        }
+
+
+# QUIZ_PROFILE_SAMPLE_RATE profiles that fraction of requests; with
+# QUIZ_PROFILE_REQUESTS=1, "profile": true in a request profiles that one.
+# QUIZ_PROFILE_FORMAT is pstats or collapsed.
+request_profiler = RequestProfiler(
+    os.environ.get('QUIZ_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')),
+    sample_rate=float(os.environ.get('QUIZ_PROFILE_SAMPLE_RATE', 0)),
+    output_format=os.environ.get('QUIZ_PROFILE_FORMAT', 'pstats').lower(),
+    allow_requested=os.environ.get('QUIZ_PROFILE_REQUESTS', '0').lower() in ('1', 'true', 'yes')
+)
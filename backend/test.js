@@ -2,6 +2,7 @@ const express = require('express');
 const router = express.Router();
 const { spawn } = require('child_process');
 const path = require('path');
+const readline = require('readline');
 
 // CSV file paths for different test types
 const TEST_FILES = {
@@ -311,8 +312,9 @@ router.get('/results/:sessionId', async (req, res) => {
             });
         }
         
-        // Calculate results
-        const results = calculateResults(session);
+        // Grade with the Python grading engine, then calculate results
+        const grade = await gradeSessionInPython(sessionId, session);
+        const results = calculateResults(session, grade);
         
         // Store test results in database (async)
         try {
@@ -394,93 +396,183 @@ router.get('/status/:sessionId', (req, res) => {
     }
 });
 
-// Helper function to load questions from Python script
-function loadQuestionsFromPython(sessionId) {
-    return new Promise((resolve, reject) => {
-        try {
-            const session = activeSessions[sessionId];
-            if (!session) {
-                return reject(new Error('Session not found'));
-            }
-            
-            // Create configuration for Python script
-            const configData = {
-                quiz_type: session.quizType,
-                num_questions: session.questionCount,
-                duration: session.timeLimit,
-                level: session.level,
-                domain: session.domain,
-                session_id: sessionId
-            };
-            
-            console.log('Loading questions with config:', configData);
-            
-            // Spawn Python process
-            const pythonProcess = spawn('python', [
-                path.join(__dirname, '../../backend-pycode.py'),
-                JSON.stringify(configData)
-            ], {
-                stdio: ['pipe', 'pipe', 'pipe']
-            });
-            
-            let dataString = '';
-            let errorString = '';
-            
-            // Collect data from Python script
-            pythonProcess.stdout.on('data', (data) => {
-                dataString += data.toString();
-            });
-            
-            // Handle errors
-            pythonProcess.stderr.on('data', (data) => {
-                errorString += data.toString();
-                console.error(`Python Error: ${data}`);
-            });
-            
-            // Set timeout for Python process
-            const timeout = setTimeout(() => {
-                pythonProcess.kill();
-                reject(new Error('Python process timeout'));
-            }, 30000); // 30 seconds timeout
-            
-            // Process completed
-            pythonProcess.on('close', (code) => {
-                clearTimeout(timeout);
-                
-                if (code !== 0) {
-                    console.error(`Python process exited with code ${code}`);
-                    console.error(`Python stderr: ${errorString}`);
-                    return reject(new Error(`Python process exited with code ${code}: ${errorString}`));
-                }
-                
-                try {
-                    // Parse the questions from Python output
-                    const questions = JSON.parse(dataString);
-                    if (!Array.isArray(questions) || questions.length === 0) {
-                        throw new Error('No questions returned from Python script');
-                    }
-                    
-                    session.questions = questions;
-                    console.log(`Loaded ${questions.length} questions successfully`);
-                    resolve();
-                } catch (error) {
-                    console.error('Failed to parse Python output:', error);
-                    console.error('Python output:', dataString);
-                    reject(new Error(`Failed to parse Python output: ${error.message}`));
-                }
-            });
+// Long-lived Python quiz worker shared by all sessions
+let quizWorker = null;
+let nextWorkerRequestId = 1;
+const pendingWorkerRequests = new Map();
 
-            pythonProcess.on('error', (error) => {
-                clearTimeout(timeout);
-                console.error('Python process error:', error);
-                reject(error);
-            });
-            
+// Fail a worker's outstanding requests and start a fresh worker on the next call
+function resetQuizWorker(workerProcess, error) {
+    if (quizWorker === workerProcess) {
+        quizWorker = null;
+    }
+    pendingWorkerRequests.forEach((pending, requestId) => {
+        if (pending.worker !== workerProcess) {
+            return;
+        }
+        clearTimeout(pending.timeout);
+        pendingWorkerRequests.delete(requestId);
+        pending.reject(error);
+    });
+}
+
+// Helper function to start (or reuse) the persistent Python quiz worker
+function getQuizWorker() {
+    if (quizWorker) {
+        return quizWorker;
+    }
+    
+    const workerProcess = spawn('python', [
+        path.join(__dirname, '../../backend-pycode.py'),
+        '--serve'
+    ], {
+        stdio: ['pipe', 'pipe', 'pipe']
+    });
+    
+    // One JSON response per line
+    const lines = readline.createInterface({ input: workerProcess.stdout });
+    lines.on('line', (line) => {
+        let response;
+        try {
+            response = JSON.parse(line);
         } catch (error) {
-            console.error('Error in loadQuestionsFromPython:', error);
-            reject(error);
+            console.error('Failed to parse quiz worker output:', line);
+            return;
+        }
+        
+        const pending = pendingWorkerRequests.get(response.request_id);
+        if (!pending) {
+            return;
         }
+        pendingWorkerRequests.delete(response.request_id);
+        clearTimeout(pending.timeout);
+        pending.resolve(response.result);
     });
+    
+    workerProcess.stderr.on('data', (data) => {
+        console.error(`Python Worker: ${data}`);
+    });
+    
+    workerProcess.on('close', (code) => {
+        console.error(`Python quiz worker exited with code ${code}`);
+        resetQuizWorker(workerProcess, new Error(`Python quiz worker exited with code ${code}`));
+    });
+    
+    workerProcess.on('error', (error) => {
+        console.error('Python quiz worker error:', error);
+        resetQuizWorker(workerProcess, error);
+    });
+    
+    // Writing to a worker that has died (EPIPE) must not crash the server
+    workerProcess.stdin.on('error', (error) => {
+        console.error('Python quiz worker stdin error:', error);
+        resetQuizWorker(workerProcess, error);
+    });
+    
+    quizWorker = workerProcess;
+    return quizWorker;
+}
+
+// Helper function to send one request to the Python quiz worker
+function requestFromQuizWorker(payload) {
+    return new Promise((resolve, reject) => {
+        const worker = getQuizWorker();
+        const requestId = nextWorkerRequestId++;
+        
+        // Set timeout for the worker response
+        // A worker that stops answering is killed and replaced, failing its other requests too
+        const timeout = setTimeout(() => {
+            worker.kill();
+            resetQuizWorker(worker, new Error('Python worker timeout'));
+        }, 30000); // 30 seconds timeout
+        
+        pendingWorkerRequests.set(requestId, { resolve, reject, timeout, worker });
+        worker.stdin.write(JSON.stringify({ ...payload, request_id: requestId }) + '\n');
+    });
+}
+
+// Helper function to select questions through the Python HTTP quiz service
+// (backend-pycode.py --http), used when QUIZ_SERVICE_URL is set
+async function requestFromQuizService(configData) {
+    const response = await fetch(`${process.env.QUIZ_SERVICE_URL}/questions`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...configData, store_session: false }),
+        signal: AbortSignal.timeout(30000)
+    });
+    const payload = await response.json();
+    if (!response.ok) {
+        return { error: payload.error || `Quiz service responded with ${response.status}` };
+    }
+    return payload.questions;
+}
+
+// Helper function to grade a session's answers with the Python grading engine,
+// through the HTTP quiz service when QUIZ_SERVICE_URL is set, else the worker
+async function gradeSessionInPython(sessionId, session) {
+    const gradeRequest = {
+        quiz_type: session.quizType,
+        sessions: [{
+            session_id: sessionId,
+            answers: session.questions.map((question, index) => ({
+                question_id: question.id,
+                chosen_option: session.answers[index]
+            })),
+            total_questions: session.questions.length
+        }]
+    };
+    
+    let results;
+    if (process.env.QUIZ_SERVICE_URL) {
+        // Results are stored by this router, so the service only grades
+        const response = await fetch(`${process.env.QUIZ_SERVICE_URL}/grade`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...gradeRequest, store_results: false }),
+            signal: AbortSignal.timeout(30000)
+        });
+        const payload = await response.json();
+        results = response.ok ? payload.results : payload;
+    } else {
+        results = await requestFromQuizWorker({ command: 'grade', ...gradeRequest });
+    }
+    if (!Array.isArray(results) || results.length === 0) {
+        throw new Error(`Python grading error: ${results && results.error}`);
+    }
+    return results[0];
+}
+
+// Helper function to load questions from the Python quiz worker
+async function loadQuestionsFromPython(sessionId) {
+    const session = activeSessions[sessionId];
+    if (!session) {
+        throw new Error('Session not found');
+    }
+    
+    // Create configuration for Python script
+    const configData = {
+        quiz_type: session.quizType,
+        num_questions: session.questionCount,
+        duration: session.timeLimit,
+        level: session.level,
+        domain: session.domain,
+        session_id: sessionId
+    };
+    
+    console.log('Loading questions with config:', configData);
+    
+    const questions = process.env.QUIZ_SERVICE_URL
+        ? await requestFromQuizService(configData)
+        : await requestFromQuizWorker(configData);
+    if (questions && questions.error) {
+        throw new Error(`Python worker error: ${questions.error}`);
+    }
+    if (!Array.isArray(questions) || questions.length === 0) {
+        throw new Error('No questions returned from Python script');
+    }
+    
+    session.questions = questions;
+    console.log(`Loaded ${questions.length} questions successfully`);
 }
 
 // Helper function to store session in database
@@ -564,25 +656,9 @@ async function storeResultsInDatabase(resultsData) {
     });
 }
 
-// Helper function to calculate test results
-function calculateResults(session) {
-    // Calculate score
-    let correctAnswers = 0;
-    session.questions.forEach((question, index) => {
-        // Handle both formats: index-based answers and letter-based answers
-        if (typeof session.answers[index] === 'number') {
-            // Index-based answer (0-3 for A-D)
-            const correctOption = ['A', 'B', 'C', 'D'].indexOf(question.correct_option.toUpperCase());
-            if (session.answers[index] === correctOption) {
-                correctAnswers++;
-            }
-        } else if (typeof session.answers[index] === 'string') {
-            // Letter-based answer (A, B, C, D)
-            if (session.answers[index].toUpperCase() === question.correct_option.toUpperCase()) {
-                correctAnswers++;
-            }
-        }
-    });
+// Helper function to calculate test results from the Python grading engine's grade
+function calculateResults(session, grade) {
+    const correctAnswers = grade.correct_answers;
     
     const score = Math.round((correctAnswers / session.questions.length) * 100);
     const timeTaken = Math.round((Date.now() - session.startTime) / 1000);
@@ -691,7 +767,12 @@ function calculateResults(session) {
         strengths,
         weaknesses,
         recommendations,
-        careerRecommendations
+        careerRecommendations,
+        breakdown: {
+            bySkill: grade.by_skill || {},
+            byDomain: grade.by_domain || {},
+            byLevel: grade.by_level || {}
+        }
     };
 }
 
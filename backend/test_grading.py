@@ -0,0 +1,43 @@
+from grading import grade_answers, grade_positions
+from question_bank import QuestionBank
+
+
+def make_bank(correct_options):
+    return QuestionBank([
+        {
+            'question': f'Question {number}?', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+            'correct_option': correct_option, 'level': 'Beginner', 'domain': 'python', 'skill': 'Python',
+            'skills': 'Python'
+        }
+        for number, correct_option in enumerate(correct_options)
+    ])
+
+
+def test_blank_correct_option_never_matches():
+    bank = make_bank(['', 'B'])
+    grade = grade_positions(bank, [0, 1], ['A', None])
+    assert grade['correct_answers'] == 0
+    assert grade['is_correct'] == [False, False]
+
+    grade = grade_positions(bank, [0], [None])
+    assert grade['correct_answers'] == 0
+
+
+def test_unanswered_questions_count_as_wrong():
+    bank = make_bank(['A', 'B', 'C'])
+    grade = grade_positions(bank, [0, 1], ['A', 'C'], total_questions=3)
+    assert grade['correct_answers'] == 1
+    assert grade['answered'] == 2
+    assert round(grade['accuracy'], 2) == 33.33
+
+
+def test_no_answers_scores_zero():
+    bank = make_bank(['', 'B'])
+    grade = grade_answers(bank, [], total_questions=2)
+    assert grade['correct_answers'] == 0
+    assert grade['answered'] == 0
+    assert grade['accuracy'] == 0
+
+    grade = grade_answers(bank, [{'question_id': bank.ids[0], 'chosen_option': ''}], total_questions=2)
+    assert grade['correct_answers'] == 0
+    assert grade['accuracy'] == 0
@@ -0,0 +1,276 @@
+import fcntl
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Marker put on the queue to ask the writer thread to exit
+_STOP = object()
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    """Hold an exclusive flock on path; yields False if not blocking and it is taken.
+
+    flock works across the pre-forked workers sharing a journal as well as
+    across threads, since each call opens its own file description.
+    """
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class WriteBehindQueue:
+    """Background writer that takes persistence off the quiz path.
+
+    Callers put(kind, payload) records on a bounded queue and return immediately.
+    A single daemon thread drains the queue, hands up to batch_size records at a
+    time to write_batch (which writes them in one transaction), and appends any
+    batch it cannot write to an append-only JSON-lines journal. The journal is
+    replayed when the writer starts and again once the database is reachable.
+
+    is_rejected(error) tells a batch the database refused (a constraint
+    violation, a bad value) from one it couldn't take (connection lost). A
+    rejected batch is retried one record at a time so one bad record can't hold
+    back the others; records that are still refused go to the dead-letter file
+    instead of the journal, since replaying them would fail forever.
+    """
+
+    def __init__(self, write_batch, journal_path, max_size=10000, batch_size=500,
+                 flush_interval=0.2, replay_interval=30, is_rejected=None, dead_letter_path=None):
+        self.write_batch = write_batch
+        self.journal_path = journal_path
+        self.is_rejected = is_rejected or (lambda error: False)
+        self.dead_letter_path = dead_letter_path or journal_path + '.rejected'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        # Every process writing to journal_path takes these: the first around
+        # appends and the rename to .replaying, the second for a whole replay
+        self._journal_lock_path = journal_path + '.lock'
+        self._replay_lock_path = journal_path + '.replay.lock'
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._last_replay = 0
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.journaled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.lost = 0
+
+    def start(self):
+        """Start the writer thread (idempotent); it replays the journal first"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def put(self, kind, payload):
+        """Queue a record without waiting; spill to the journal if the queue is full"""
+        self.start()
+        record = {'kind': kind, 'payload': payload}
+        try:
+            self._queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self._append_journal([record])
+
+    def stop(self, timeout=10):
+        """Flush what is queued and stop the writer; anything left over is journaled"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+        leftovers = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not _STOP:
+                leftovers.append(record)
+        if leftovers:
+            self._append_journal(leftovers)
+
+    def _run(self):
+        self._replay_logged(self.replay_journal)
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._replay_logged(self._maybe_replay)
+                continue
+            if record is _STOP:
+                return
+
+            # Coalesce whatever else is already waiting into the same transaction
+            batch = [record]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch):
+        """Write a batch and journal what didn't make it; errors are logged so the thread keeps running"""
+        try:
+            unwritten = self._write_or_split(batch)
+        except Exception as e:
+            # A failure outside write_batch (is_rejected, the dead-letter file); keep the batch
+            self.failures += 1
+            print(f"Write-behind error ({len(batch)} records): {e}", file=sys.stderr)
+            unwritten = batch
+        if not unwritten:
+            self._replay_logged(self._maybe_replay)
+            return
+        try:
+            self._append_journal(unwritten)
+        except Exception as e:
+            self.lost += len(unwritten)
+            print(f"Write-behind journal error, {len(unwritten)} records lost: {e}", file=sys.stderr)
+
+    def _replay_logged(self, replay):
+        # A replay that fails part-way leaves .replaying behind and is picked up next time
+        try:
+            replay()
+        except Exception as e:
+            print(f"Write-behind journal replay error: {e}", file=sys.stderr)
+
+    def _write(self, batch):
+        """Write one batch; returns None on success, otherwise the error"""
+        try:
+            self.write_batch(batch)
+            self.written += len(batch)
+            self.batches += 1
+            return None
+        except Exception as e:
+            self.failures += 1
+            print(f"Write-behind error ({len(batch)} records): {e}", file=sys.stderr)
+            return e
+
+    def _write_or_split(self, batch):
+        """Write a batch, isolating rejected records; returns the records left to journal"""
+        error = self._write(batch)
+        if error is None:
+            return []
+        if not self.is_rejected(error):
+            return batch
+        for index, record in enumerate(batch):
+            error = self._write([record])
+            if error is None:
+                continue
+            if not self.is_rejected(error):
+                # The database went away mid-retry; keep this record and the rest
+                return batch[index:]
+            self._append_dead_letter(record, error)
+        return []
+
+    def _append_dead_letter(self, record, error):
+        with _file_lock(self._journal_lock_path):
+            with open(self.dead_letter_path, 'a') as f:
+                f.write(json.dumps(dict(record, error=str(error), rejected_at=time.time())) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.dead_lettered += 1
+        print(f"Write-behind record rejected ({record['kind']}), moved to {self.dead_letter_path}: {error}",
+              file=sys.stderr)
+
+    def _append_journal(self, records):
+        with _file_lock(self._journal_lock_path):
+            with open(self.journal_path, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.journaled += len(records)
+
+    def _maybe_replay(self):
+        if time.time() - self._last_replay >= self.replay_interval and os.path.exists(self.journal_path):
+            self.replay_journal()
+
+    def replay_journal(self):
+        """Write journaled records back to the database; unwritten records are re-journaled"""
+        self._last_replay = time.time()
+        with _file_lock(self._replay_lock_path, blocking=False) as locked:
+            # Another process sharing the journal is replaying it already
+            if locked:
+                self._replay()
+
+    def _replay(self):
+        replaying_path = self.journal_path + '.replaying'
+        with _file_lock(self._journal_lock_path):
+            # Only the replay lock holder touches .replaying, so one found here
+            # was left by a crash mid-replay; pick it up
+            if not os.path.exists(replaying_path):
+                if not os.path.exists(self.journal_path):
+                    return
+                os.replace(self.journal_path, replaying_path)
+
+        records = []
+        with open(replaying_path) as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        print(f"Skipping corrupt journal line: {line[:80]!r}", file=sys.stderr)
+
+        failed = []
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            dead_lettered = self.dead_lettered
+            unwritten = self._write_or_split(batch)
+            self.replayed += len(batch) - len(unwritten) - (self.dead_lettered - dead_lettered)
+            if unwritten:
+                failed.extend(unwritten)
+                # The database is still unavailable; keep the rest for the next attempt
+                failed.extend(records[start + self.batch_size:])
+                break
+
+        if failed:
+            self._append_journal(failed)
+        os.remove(replaying_path)
+
+    def stats(self):
+        """Return queue depth and throughput counters"""
+        return {
+            'queued': self._queue.qsize(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'journaled': self.journaled,
+            'replayed': self.replayed,
+            'failures': self.failures,
+            'dead_lettered': self.dead_lettered,
+            'lost': self.lost,
+            'journal_pending': os.path.exists(self.journal_path)
+        }